@@ -2,201 +2,458 @@ from flask import (
     Flask,
     render_template,
     request,
-    redirect,
-    url_for,
-    session,
     abort,
 )
 import requests
 from datetime import datetime
-from collections import defaultdict
+import copy
 import os
-import hashlib
+
+import click
+
+import gallery_api
+import judging
+import metrics
+import thumbnails
+from contest import (
+    CONTESTS,
+    CURRENT_YEAR,
+    build_user_photos,
+    contest_for_slug,
+    patch_user_photos,
+)
+from inat import INatClient, slim_observation
+from inat_async import FETCH_ERRORS, AsyncINatClient
+from obs_cache import ObservationCache
+from page_archive import PageArchive
+from page_cache import PageCache, source_digest
+from snapshot import SnapshotStore
+from sync import sync_project
+from taxa import TaxonStore
 
 app = Flask(__name__)
 
 # ------------------------------------------------------------------
-# Constants
+# Configuration
 # ------------------------------------------------------------------
-VALID_START_DATE = datetime.strptime("2025-08-01", "%Y-%m-%d")
-VALID_END_DATE = datetime.strptime("2026-08-31", "%Y-%m-%d")
-
-VERTEBRATES = ["Mammalia", "Aves", "Reptilia", "Amphibia", "Actinopterygii"]
-ARTHROPODS = ["Insecta", "Arachnida", "Crustacea", "Myriapoda"]
-
 app.config["SECRET_KEY"] = "your_secret_key"  # change for production!
-CACHE_FILE = "validated_observations.json"
+app.config["OBSERVATION_CACHE_DIR"] = os.environ.get("OBSERVATION_CACHE_DIR", "cache")
+app.config["OBSERVATION_CACHE_TTL"] = int(os.environ.get("OBSERVATION_CACHE_TTL", 600))
+app.config["INCREMENTAL_SYNC"] = os.environ.get("INCREMENTAL_SYNC", "1") == "1"
+app.config["ASYNC_FETCH"] = os.environ.get("ASYNC_FETCH", "1") == "1"
+app.config["FETCH_DEADLINE"] = int(os.environ.get("FETCH_DEADLINE", 900))
+app.config["JUDGING_YEAR"] = int(os.environ.get("JUDGING_YEAR", 2024))
+app.config["THUMBNAIL_DIR"] = os.environ.get("THUMBNAIL_DIR", "cache/thumbs")
+app.config["THUMBNAIL_CACHE_MB"] = int(os.environ.get("THUMBNAIL_CACHE_MB", 512))
+app.config["THUMBNAIL_PREWARM"] = os.environ.get("THUMBNAIL_PREWARM", "1") == "1"
+app.config["QUEUE_DIR"] = os.environ.get("QUEUE_DIR", "cache")
+app.config["PROFILE_REQUESTS"] = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", "cache/profiles")
+app.config["PAGE_ARCHIVE"] = os.environ.get("PAGE_ARCHIVE", "0") == "1"
+app.config["PAGE_ARCHIVE_DIR"] = os.environ.get("PAGE_ARCHIVE_DIR", "cache/archive")
+app.config["ARCHIVE_REPLAY"] = os.environ.get("ARCHIVE_REPLAY", "0") == "1"
+# Part of the rendered pages' ETags; defaults to a digest of the templates and code.
+app.config["BUILD_ID"] = os.environ.get("BUILD_ID") or source_digest(app.root_path)
+app.config["SQLALCHEMY_DATABASE_URI"] = (
+    f"sqlite:///{os.path.join(os.getcwd(), 'evaluations.db')}"
+)
+app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 
 # ------------------------------------------------------------------
-# Helpers
+# Data pipeline
 # ------------------------------------------------------------------
-def first_photo(observation):
-    """Return the first photo-dict or None if none/invalid."""
-    photos = observation.get("photos") or []
-    return photos[0] if photos and isinstance(photos[0], dict) else None
+page_archive = PageArchive(app.config["PAGE_ARCHIVE_DIR"], logger=app.logger)
+recorded_pages = page_archive if app.config["PAGE_ARCHIVE"] else None
+inat_client = INatClient(archive=recorded_pages, logger=app.logger)
+async_inat_client = AsyncINatClient(
+    bucket=inat_client.bucket, archive=recorded_pages, logger=app.logger
+)
+taxon_store = TaxonStore(
+    os.path.join(app.config["OBSERVATION_CACHE_DIR"], "taxa.db"),
+    client=inat_client,
+    logger=app.logger,
+)
+
+
+def slim(obs):
+    """Keep a raw observation's taxon in the taxon store, then slim the record."""
+    taxon_store.stage(obs.get("taxon"))
+    return slim_observation(obs)
+
 
+def stream_project_observations(project_slug):
+    """Stream a project's observations, slimmed to the fields we use, as pages arrive.
 
-def is_valid_date(observed_date: str | None) -> bool:
-    """Return True iff the date string exists & falls inside the allowed window."""
-    if not observed_date:
-        return False
+    On the asyncio client unless ASYNC_FETCH is off; with ARCHIVE_REPLAY the
+    last archived fetch is replayed instead, without the network.
+    """
     try:
-        date_str = observed_date.split("T")[0]  # handle ISO strings
-        date = datetime.strptime(date_str, "%Y-%m-%d")
-        return VALID_START_DATE <= date <= VALID_END_DATE
-    except ValueError:
-        return False
-
-
-def categorize_photo(observation):
-    ancestor_ids = (observation.get("taxon") or {}).get("ancestor_ids", "")
-    if 355675 in ancestor_ids:  # ID for Vertebrata
-        return "vertebrates"
-    if 47120 in ancestor_ids:  # ID for Arthropoda
-        return "arthropods"
-    return "others"
-
-
-def get_validation_categories(observation):
-    """Return a list of validation flags for a single observation."""
-    categories = []
-
-    photo_obj = first_photo(observation)
-    if photo_obj is None:
-        categories.append("no-photo")
-        return categories
-
-    if not is_valid_date(observation.get("observed_on")):
-        categories.append("date-before-september")
-
-    if photo_obj.get("license_code") not in {"cc-by", "cc-by-sa", "cc0"}:
-        categories.append("non-compatible-license")
-
-    if observation.get("quality_grade") != "research":
-        categories.append("non-research-grade")
-        # “needs_id” fast-track
-        taxon_rank = (observation.get("taxon") or {}).get("rank", "")
-        if (
-            observation.get("quality_grade") == "needs_id"
-            and is_valid_date(observation.get("observed_on"))
-            and photo_obj.get("license_code") in {"cc-by", "cc-by-sa", "cc0"}
-            and observation.get("num_identification_agreements", 0) >= 2
-            and taxon_rank == "genus"
-        ):
-            categories.append("validated")
-
-    if not categories:
-        categories.append("validated")
-
-    return categories
-
-
-def organize_photos_by_user(valid_photos, unvalidated_photos):
-    user_photos = defaultdict(
-        lambda: {"validated": defaultdict(list), "unvalidated": defaultdict(list)}
-    )
+        if app.config["ARCHIVE_REPLAY"]:
+            yield from map(slim, page_archive.iter_observations(project_slug))
+        elif app.config["ASYNC_FETCH"]:
+            yield from async_inat_client.iter_project_observations_sync(
+                project_slug, transform=slim, deadline=app.config["FETCH_DEADLINE"]
+            )
+        else:
+            yield from map(slim, inat_client.iter_project_observations(project_slug))
+    finally:
+        taxon_store.flush()
 
-    for category, photos in valid_photos.items():
-        for photo in photos:
-            user_photos[photo["author"]]["validated"][category].append(photo)
 
-    for category, photos in unvalidated_photos.items():
-        for photo in photos:
-            user_photos[photo["author"]]["unvalidated"][category].append(photo)
+def fetch_project_observations(project_slug, consume=None):
+    """Full fetch of a project as a list ([] on failure).
 
-    return dict(sorted(user_photos.items()))  # alphabetic order
+    `consume(stream)`, if given, is handed the observations as they arrive
+    and must exhaust them, e.g. to classify each page while the next ones
+    download; they are returned as a list all the same.
+    """
+    observations = []
 
+    def collect():
+        for obs in stream_project_observations(project_slug):
+            observations.append(obs)
+            yield obs
 
-# ------------------------------------------------------------------
-# Routes
-# ------------------------------------------------------------------
-@app.route("/logout")
-def logout():
-    session.pop("username", None)
-    if os.path.exists(CACHE_FILE):
-        os.remove(CACHE_FILE)
-    return redirect(url_for("login"))
-
-
-def fetch_project_observations(project_slug):
-    per_page = 200
-    page = 1
-    all_results = []
-
-    while True:
-        url = (
-            f"https://api.inaturalist.org/v1/observations?"
-            f"project_id={project_slug}&per_page={per_page}&page={page}&order_by=observed_on"
+    try:
+        if consume is None:
+            observations = list(stream_project_observations(project_slug))
+        else:
+            consume(collect())
+    except LookupError as e:  # nothing archived to replay
+        app.logger.error(str(e))
+        return []
+    except (requests.exceptions.RequestException, *FETCH_ERRORS) as e:
+        app.logger.error(f"Failed to fetch data: {str(e) or type(e).__name__}")
+        return []
+    return observations
+
+
+streamed_snapshots = {}  # project slug -> the observations its snapshot was built from
+
+
+def fetch_and_build(project_slug):
+    """Full fetch that builds the gallery snapshot from the pages as they arrive.
+
+    Classification overlaps the downloads; `publish_snapshot` then finds the
+    snapshot already built from these observations and only publishes it.
+    """
+    observations = fetch_project_observations(
+        project_slug, lambda stream: gallery_snapshots.rebuild(project_slug, stream)
+    )
+    if observations:
+        streamed_snapshots[project_slug] = observations
+    return observations
+
+
+def load_project_observations(project_slug):
+    """Refresh hook for the cache: incremental sync, or a full re-fetch if disabled.
+
+    The incremental sync only reclassifies the few records it brings in, so
+    only the full re-fetch builds the snapshot while it downloads.
+    """
+    if app.config["INCREMENTAL_SYNC"] and not app.config["ARCHIVE_REPLAY"]:
+        return sync_project(
+            app.config["OBSERVATION_CACHE_DIR"],
+            project_slug,
+            client=inat_client,
+            taxa=taxon_store,
         )
+    return fetch_and_build(project_slug)
+
+
+def publish_snapshot(project_slug, observations):
+    """Rebuild the gallery snapshot whenever the cache stores new observations."""
+    if streamed_snapshots.pop(project_slug, None) is observations:
+        snapshot = gallery_snapshots.get(project_slug)  # built while they streamed in
+    else:
+        snapshot = gallery_snapshots.rebuild(project_slug, observations)
+    prewarm_thumbnails(snapshot)
+
+
+warmed_snapshots = set()  # versions whose thumbnails this process has warmed
+
+
+def prewarm_thumbnails(snapshot):
+    """Fetch a snapshot's card thumbnails in the background, once per version."""
+    if not app.config["THUMBNAIL_PREWARM"] or snapshot["version"] in warmed_snapshots:
+        return
+    warmed_snapshots.add(snapshot["version"])
+    app.extensions["thumbnails"].warm_in_background(snapshot_photo_urls(snapshot))
+
+
+def snapshot_photo_urls(snapshot):
+    """Every card photo of a snapshot, once each."""
+    return {
+        record.photo_url
+        for buckets in snapshot["user_photos"].values()
+        for categories in buckets.values()
+        for records in categories.values()
+        for record in records
+        if record.photo_url
+    }
+
+
+shown_photos = {}  # "ids": card photo ids of the "versions" of every contest's snapshot
+
+
+def shown_photo_ids():
+    """Photo ids on the cards of every contest's current snapshot: the proxy's allow-list."""
+    snapshots = [gallery_snapshots.get(c.project_slug) for c in CONTESTS.values()]
+    versions = [snapshot and snapshot["version"] for snapshot in snapshots]
+    if shown_photos.get("versions") != versions:
+        shown_photos["ids"] = {
+            thumbnails.photo_id_of(url)
+            for snapshot in snapshots
+            if snapshot is not None
+            for url in snapshot_photo_urls(snapshot)
+        }
+        shown_photos["versions"] = versions
+    return shown_photos["ids"]
+
+
+def cached_observations(project_slug):
+    """Observations from the cache; frozen editions are never revalidated."""
+    frozen = contest_for_slug(project_slug).frozen
+    return observation_cache.get(project_slug, revalidate=not frozen)
+
+
+def observation_taxa(observations):
+    """{taxon_id: taxon} for the observations, looking up unknown taxa in batches."""
+    return taxon_store.lookup((obs.get("taxon") or {}).get("id") for obs in observations)
+
+
+def build_gallery(project_slug, observations, previous=None):
+    """Patch the previous gallery with the observations whose fingerprint changed.
+
+    A list has its taxa looked up first; a live stream (see `fetch_and_build`)
+    is classified against the taxon store as its taxa are staged.
+    """
+    if isinstance(observations, list):
+        taxa = observation_taxa(observations)
+    else:
+        taxa = taxon_store
+    return patch_user_photos(
+        observations, contest_for_slug(project_slug), previous, taxa
+    )
+
+
+observation_cache = ObservationCache(
+    load_project_observations,
+    cache_dir=app.config["OBSERVATION_CACHE_DIR"],
+    ttl=app.config["OBSERVATION_CACHE_TTL"],
+    logger=app.logger,
+    on_refresh=publish_snapshot,
+)
+gallery_snapshots = SnapshotStore(
+    build_gallery,
+    snapshot_dir=app.config["OBSERVATION_CACHE_DIR"],
+    logger=app.logger,
+)
+rendered_pages = PageCache(app.config["BUILD_ID"])
+
+
+def current_snapshot(contest):
+    """A contest's gallery snapshot; stale ones are refreshed off-request."""
+    project_slug = contest.project_slug
+    snapshot = gallery_snapshots.get(project_slug)
+
+    if snapshot is None:
+        # Cold start: nothing built yet, so build it once from the observations.
+        # A failed taxa lookup leaves no snapshot behind, so the next request retries.
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            results = response.json().get("results", [])
-            if not results:
-                break
-            all_results.extend(results)
-            if len(results) < per_page:
-                break
-            page += 1
-        except requests.exceptions.RequestException as e:
-            app.logger.error(f"Failed to fetch data: {e}")
-            break
-
-    return all_results
+            observations = cached_observations(project_slug)
+            if not observations:
+                abort(500, description="Failed to fetch data from the API")
+            snapshot = gallery_snapshots.get(
+                project_slug
+            ) or gallery_snapshots.rebuild(project_slug, observations)
+        except requests.exceptions.RequestException:
+            abort(500, description="Failed to fetch taxa from the API")
+    elif (
+        not contest.frozen
+        and gallery_snapshots.age(snapshot) > app.config["OBSERVATION_CACHE_TTL"]
+    ):
+        # Serve what we have; the refresh rebuilds the snapshot off-request.
+        observation_cache.refresh_in_background(project_slug)
+    prewarm_thumbnails(snapshot)
+    return snapshot
+
+
+metrics.init_app(app)
+judging.init_app(app, cached_observations, taxon_store)
+gallery_api.init_app(app, current_snapshot)
+thumbnails.init_app(app, shown_photo_ids)
 
 
+# ------------------------------------------------------------------
+# Routes
+# ------------------------------------------------------------------
 @app.route("/")
 def index():
-    project_slug = "wikiconcurso-fotografico-inaturalist-2026"
-    observations = fetch_project_observations(project_slug)
+    return gallery(CURRENT_YEAR)
+
+
+@app.route("/<int:year>/")
+def gallery(year):
+    contest = CONTESTS.get(year)
+    if contest is None:
+        abort(404)
+    snapshot = current_snapshot(contest)
+
+    page = rendered_pages.get(
+        contest.project_slug,
+        snapshot,
+        lambda: render_template(
+            contest.template, user_photos=snapshot["user_photos"], datetime=datetime
+        ),
+    )
+    return page.response(request)
+
 
+# ------------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------------
+def project_for_year(year):
+    if year not in CONTESTS:
+        raise click.BadParameter(f"no contest configured for {year}", param_hint="YEAR")
+    return CONTESTS[year].project_slug
+
+
+@app.cli.command("sync")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+@click.option("--full", is_flag=True, help="Discard the local store and re-fetch.")
+def sync_command(year, full):
+    """Sync a contest's observations and refresh its gallery (cron-friendly)."""
+    project_slug = project_for_year(year)
+    with observation_cache.refresh_lock(project_slug):  # web workers wait, not fetch
+        observations = sync_project(
+            app.config["OBSERVATION_CACHE_DIR"],
+            project_slug,
+            full,
+            client=inat_client,
+            taxa=taxon_store,
+        )
+        if not observations:
+            raise click.ClickException(f"No observations synced for {project_slug}")
+        observation_cache.put(project_slug, observations)  # also rebuilds the snapshot
+    click.echo(f"{project_slug}: {len(observations)} observations")
+
+
+@app.cli.command("refresh")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+def refresh_command(year):
+    """Re-fetch a contest's whole project and refresh its gallery."""
+    project_slug = project_for_year(year)
+    with observation_cache.refresh_lock(project_slug):
+        observations = fetch_and_build(project_slug)
+        if not observations:
+            raise click.ClickException(f"No observations fetched for {project_slug}")
+        observation_cache.put(project_slug, observations)  # publishes the snapshot
+    click.echo(f"{project_slug}: {len(observations)} observations")
+
+
+@app.cli.command("snapshot")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+def snapshot_command(year):
+    """Rebuild a contest's gallery snapshot from the cached observations."""
+    project_slug = project_for_year(year)
+    observations = cached_observations(project_slug)
     if not observations:
-        abort(500, description="Failed to fetch data from the API")
-
-    valid_photos = {"vertebrates": [], "arthropods": [], "others": []}
-    unvalidated_photos = {}
-
-    for obs in observations:
-        photo = first_photo(obs)
-        if photo is None:
-            continue  # nothing to show
-
-        validation_categories = get_validation_categories(obs)
-
-        record = {
-            "observation_id": obs.get("id") or "",
-            "photo": photo,
-            "author": (obs.get("user") or {}).get("login", "Unknown"),
-            "date": obs.get("observed_on", "Unknown"),
-            "license": photo.get("license_code", ""),
-            "species": (obs.get("taxon") or {}).get("name", "Unknown"),
-            "validation_categories": validation_categories,
-        }
+        raise click.ClickException(f"No observations available for {project_slug}")
+    try:
+        snapshot = gallery_snapshots.rebuild(project_slug, observations)
+    except requests.exceptions.RequestException as e:
+        raise click.ClickException(f"Taxon lookup for {project_slug} failed: {e}")
+    click.echo(
+        f"{project_slug}: snapshot {snapshot['version']}, "
+        f"{len(snapshot['user_photos'])} users"
+    )
 
-        if "validated" in validation_categories:
-            valid_photos[categorize_photo(obs)].append(record)
-        else:
-            for cat in validation_categories:
-                unvalidated_photos.setdefault(cat, []).append(record)
 
-    user_photos = organize_photos_by_user(valid_photos, unvalidated_photos)
+@app.cli.command("warm-thumbnails")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+def warm_thumbnails_command(year):
+    """Fetch the card thumbnails of a contest's gallery that are not cached yet."""
+    project_slug = project_for_year(year)
+    snapshot = gallery_snapshots.get(project_slug)
+    if snapshot is None:
+        raise click.ClickException(f"No snapshot built for {project_slug} yet")
+    urls = snapshot_photo_urls(snapshot)
+    fetched = app.extensions["thumbnails"].warm(urls)
+    click.echo(f"{project_slug}: {fetched} of {len(urls)} thumbnails fetched")
+
+
+@app.cli.command("archive")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+def archive_command(year):
+    """Fetch a contest's whole project into the page archive."""
+    project_slug = project_for_year(year)
+    client = copy.copy(inat_client)  # same session and rate limit, recording
+    client.archive = page_archive
+    try:
+        count = sum(1 for _ in client.iter_project_observations(project_slug))
+    except requests.exceptions.RequestException as e:
+        raise click.ClickException(f"Fetch of {project_slug} failed: {e}")
+    fetch = page_archive.latest(project_slug)
+    click.echo(
+        f"{project_slug}: fetch {fetch['id']}, {count} observations in "
+        f"{fetch['pages']} pages, {fetch['bytes'] / 2**20:.1f} MiB compressed"
+    )
+
 
-    # enforce max-three validated per user / taxon-category
-    for tcat in ("vertebrates", "arthropods", "others"):
-        for user, buckets in user_photos.items():
-            validated = buckets["validated"][tcat]
-            if len(validated) > 3:
-                buckets["unvalidated"]["more-than-three"].extend(validated[3:])
-                buckets["validated"][tcat] = validated[:3]
+@app.cli.command("archive-list")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+def archive_list_command(year):
+    """List the archived fetches of a contest's project."""
+    for fetch in page_archive.fetches(project_for_year(year)):
+        started = datetime.fromtimestamp(fetch["started_at"])
+        status = "complete" if fetch["finished_at"] else "incomplete"
+        click.echo(
+            f"{fetch['id']:>5}  {started:%Y-%m-%d %H:%M:%S}  {fetch['pages']:>4} pages  "
+            f"{fetch['observations']:>7} observations  {status}"
+        )
 
-    return render_template(
-        "index_2026.html", user_photos=user_photos, datetime=datetime
-    )
+
+@app.cli.command("revalidate")
+@click.argument("year", type=int, default=CURRENT_YEAR)
+@click.option(
+    "--as-of",
+    type=click.DateTime(),
+    help="Use the last fetch started by then (default: the latest).",
+)
+@click.option(
+    "--taxon-rule",
+    type=click.Choice(["ancestors", "iconic"]),
+    help="Override the edition's taxon-group rule.",
+)
+def revalidate_command(year, as_of, taxon_rule):
+    """Re-classify an archived fetch of a contest offline and report the counts."""
+    project_slug = project_for_year(year)
+    contest = copy.copy(CONTESTS[year])
+    if taxon_rule:
+        contest.taxon_rule = taxon_rule
+    try:
+        observations = page_archive.iter_observations(
+            project_slug, as_of.timestamp() if as_of else None
+        )
+        # Raw archived observations carry their whole taxon: no store lookups.
+        user_photos = build_user_photos(observations, contest)
+    except LookupError as e:
+        raise click.ClickException(str(e))
+
+    totals = {}
+    for buckets in user_photos.values():
+        for kind, categories in buckets.items():
+            for category, records in categories.items():
+                totals[kind, category] = totals.get((kind, category), 0) + len(records)
+    click.echo(f"{project_slug} ({contest.taxon_rule} rule): {len(user_photos)} users")
+    for (kind, category), count in sorted(totals.items()):
+        click.echo(f"  {kind:>11} {category:<24} {count:>6}")
 
 
 # ------------------------------------------------------------------
 # Entrypoint
 # ------------------------------------------------------------------
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True)  # judging.init_app has migrated evaluations.db
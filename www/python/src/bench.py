@@ -0,0 +1,752 @@
+"""Offline benchmarks on synthetic iNaturalist observations.
+
+    python bench.py suite --sizes 1000,10000,100000 --output results.json
+    python bench.py compare baseline.json results.json
+    python bench.py fixtures --count 10000 --out fixtures/
+    python bench.py classify --count 100000
+    python bench.py records --count 50000
+    python bench.py bucketing --count 100000
+    python bench.py delta --count 100000
+
+`suite` times each stage of the pipeline on its own (fetching from a local
+stub API, classification, bucketing, rendering, the judging database) and
+writes machine-readable results that `compare` checks for regressions.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+import click
+from flask import Flask, render_template
+
+from contest import (
+    CONTESTS,
+    CURRENT_YEAR,
+    TAXON_CATEGORIES,
+    PhotoRecord,
+    UserBuckets,
+    build_user_photos,
+    categorize_photo,
+    classify_batch,
+    first_photo,
+    get_validation_categories,
+    iter_pages,
+    patch_user_photos,
+)
+from inat import INatClient, slim_observation
+from inat_async import AsyncINatClient
+from taxa import taxon_record
+
+LICENSES = ["cc-by", "cc-by-sa", "cc0", "cc-by-nc", "cc-by-nc-sa", None]
+GRADES = ["research", "needs_id", "casual"]
+RANKS = ["species", "genus", "subspecies", "family"]
+# taxon group -> (ancestries, iconic names) consistent with both taxon rules
+TAXA = {
+    "vertebrates": (
+        [[48460, 1, 2, 355675, 3], [48460, 1, 2, 355675, 40151]],
+        ["Aves", "Mammalia"],
+    ),
+    "arthropods": (
+        [[48460, 1, 47120, 47158], [48460, 1, 47120, 47119]],
+        ["Insecta", "Arachnida"],
+    ),
+    "others": ([[48460, 47126, 211194], [48460, 47170, 48250]], ["Plantae", "Fungi"]),
+}
+DEFAULT_MIX = {
+    "licenses": dict(zip(LICENSES, (5, 2, 2, 2, 1, 1))),
+    "grades": dict(zip(GRADES, (6, 3, 1))),
+    "taxa": {"vertebrates": 1, "arthropods": 1, "others": 1},
+    "in_window": 0.85,  # share of dated observations inside the contest window
+    "undated": 0.02,
+    "no_photo": 0.01,
+}
+PHOTO_BASE = "https://inaturalist-open-data.s3.amazonaws.com/photos"
+
+
+def parse_weights(text):
+    """"cc-by=5,cc0=2,none=1" -> {"cc-by": 5.0, "cc0": 2.0, None: 1.0}."""
+    weights = {}
+    for item in text.split(","):
+        key, _, weight = item.partition("=")
+        weights[None if key == "none" else key] = float(weight or 1)
+    return weights
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def synthetic_observations(count, seed=0, year=CURRENT_YEAR, mix=None, raw=False):
+    """Return `count` observations with a realistic mix of every rule's inputs.
+
+    `mix` overrides `DEFAULT_MIX` keys.  With `raw`, records have the full
+    `/v1/observations` shape (identifications, every photo, the taxon tree)
+    instead of the `slim_observation` projection.
+    """
+    mix = {**DEFAULT_MIX, **(mix or {})}
+    rng = random.Random(seed)
+    contest = CONTESTS[year]
+    start = contest.valid_start_date.toordinal()
+    end = contest.valid_end_date.toordinal()
+    observations = []
+    for i in range(1, count + 1):
+        if rng.random() < mix["in_window"]:
+            ordinal = rng.randint(start, end)
+        else:
+            outside = (start - 1 - rng.randrange(180), end + 1 + rng.randrange(60))
+            ordinal = rng.choice(outside)
+        observed_on = date.fromordinal(ordinal).isoformat()
+        group = _pick(rng, mix["taxa"])
+        ancestries, iconic = TAXA[group]
+        taxon_id = rng.randrange(1, 50000)
+        photos = [
+            {
+                "id": i * 10 + n,
+                "url": f"{PHOTO_BASE}/{i * 10 + n}/square.jpg",
+                "license_code": _pick(rng, mix["licenses"]),
+                "attribution": f"(c) user{i % 997}",
+            }
+            for n in range(rng.randint(1, 3) if raw else 1)
+        ]
+        obs = {
+            "id": i,
+            "observed_on": observed_on if rng.random() >= mix["undated"] else None,
+            "updated_at": f"{observed_on}T12:00:00Z",
+            "quality_grade": _pick(rng, mix["grades"]),
+            "num_identification_agreements": rng.randrange(4),
+            "photos": photos if rng.random() >= mix["no_photo"] else [],
+            "user": {"login": f"user{rng.randrange(1000)}"},
+            "taxon": {
+                "id": taxon_id,
+                "name": f"Taxon {taxon_id % 5000}",
+                "rank": rng.choices(RANKS, weights=(6, 2, 1, 1))[0],
+                "ancestor_ids": ancestries[taxon_id % len(ancestries)],
+                "iconic_taxon_name": iconic[taxon_id % len(iconic)],
+            },
+        }
+        if raw:
+            obs["user"].update(id=i % 1000, name=f"User {i % 1000}", icon_url=None)
+            obs["taxon"].update(
+                preferred_common_name=f"Common {taxon_id % 5000}",
+                observations_count=taxon_id * 3,
+                threatened=False,
+            )
+            obs.update(
+                uri=f"https://www.inaturalist.org/observations/{i}",
+                species_guess=obs["taxon"]["name"],
+                place_guess="Brasil",
+                geojson={"type": "Point", "coordinates": [-47.9, -15.8]},
+                description=None,
+                identifications=[
+                    {
+                        "id": i * 4 + n,
+                        "user": {"login": f"user{(i + n) % 1000}"},
+                        "taxon": {"id": taxon_id},
+                        "current": True,
+                        "category": "supporting",
+                    }
+                    for n in range(rng.randint(1, 4))
+                ],
+                comments=[],
+            )
+        observations.append(obs)
+    return observations
+
+
+def api_pages(observations, per_page=200):
+    """Split observations into `/v1/observations` response bodies, page 1 first."""
+    return [
+        {
+            "total_results": len(observations),
+            "page": page + 1,
+            "per_page": per_page,
+            "results": observations[page * per_page : (page + 1) * per_page],
+        }
+        for page in range(max(1, -(-len(observations) // per_page)))
+    ]
+
+
+class StubAPI:
+    """A local `/v1/observations` server over fixture pages, for timings and tests.
+
+    `requests` counts every request and `paginations` the page-1 requests
+    that start a full pass over the project; `delay` slows each response.
+    `faults` maps a page number to what its next requests get instead, in
+    order: an HTTP status with headers (`(429, {"Retry-After": "1"})`) or
+    an extra delay in seconds.
+    """
+
+    def __init__(self, observations, per_page=200, delay=0, faults=None):
+        pages = api_pages(observations, per_page)
+        self._bodies = [json.dumps(page).encode() for page in pages]
+        self._faults = {page: list(queue) for page, queue in (faults or {}).items()}
+        self.requests = 0
+        self.paginations = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                query = parse_qs(urlparse(self.path).query)
+                page = int(query.get("page", ["1"])[0])
+                stub.paginations += page == 1
+                time.sleep(delay)
+                status, headers = 200, {}
+                queue = stub._faults.get(page)
+                fault = queue.pop(0) if queue else None
+                if isinstance(fault, tuple):
+                    status, headers = fault
+                elif fault is not None:
+                    time.sleep(fault)
+                body = stub._bodies[page - 1] if page <= len(stub._bodies) else b"{}"
+                if status != 200:
+                    body = b"{}"
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on this request (timeout, cancel)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@click.group()
+def cli():
+    """Offline benchmarks."""
+
+
+@cli.command()
+@click.option("--count", default=100000, help="Synthetic observations to classify.")
+@click.option("--year", default=CURRENT_YEAR, help="Contest whose rules to apply.")
+def classify(count, year):
+    """Per-observation vs batch classification, checking they agree."""
+    contest = CONTESTS[year]
+    observations = synthetic_observations(count, year=year)
+
+    start = time.perf_counter()
+    expected = []
+    for obs in observations:
+        categories = get_validation_categories(obs, contest)
+        group = categorize_photo(obs, contest) if "validated" in categories else None
+        expected.append((categories, group))
+    per_observation = time.perf_counter() - start
+
+    start = time.perf_counter()
+    got = []
+    date_cache = {}
+    for page in iter_pages(observations):
+        categories, groups = classify_batch(page, contest, date_cache)
+        got.extend(
+            (list(c), g if "validated" in c else None) for c, g in zip(categories, groups)
+        )
+    batch = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, got) if a != b)
+    click.echo(f"per-observation: {per_observation:.3f}s")
+    click.echo(f"batch:           {batch:.3f}s ({per_observation / batch:.1f}x)")
+    click.echo(f"mismatches:      {mismatches} of {count}")
+    if mismatches:
+        raise click.ClickException("batch classification disagrees")
+
+
+def _dict_record(obs, photo, categories):
+    """The per-card dict the gallery used to build, kept for comparison."""
+    return {
+        "observation_id": obs.get("id") or "",
+        "photo": photo,
+        "author": (obs.get("user") or {}).get("login", "Unknown"),
+        "date": obs.get("observed_on", "Unknown"),
+        "license": photo.get("license_code", ""),
+        "species": (obs.get("taxon") or {}).get("name", "Unknown"),
+        "validation_categories": list(categories),
+    }
+
+
+@cli.command()
+@click.option("--count", default=50000, help="Synthetic observations to turn into cards.")
+def records(count):
+    """Memory kept alive and build time of dict cards vs PhotoRecord.
+
+    Memory is measured after the source observations are dropped, as in
+    the gallery build: a dict card keeps its whole photo dict alive.
+    """
+    contest = CONTESTS[CURRENT_YEAR]
+    for name, make in (("dict", _dict_record), ("PhotoRecord", PhotoRecord.from_observation)):
+        tracemalloc.start()
+        observations = [o for o in synthetic_observations(count) if first_photo(o)]
+        categories, _ = classify_batch(observations, contest)
+
+        start = time.perf_counter()
+        built = [make(o, first_photo(o), c) for o, c in zip(observations, categories)]
+        elapsed = time.perf_counter() - start
+        del observations, categories
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        click.echo(
+            f"{name:>12}: {elapsed:.3f}s, {size / 2**20:6.1f} MiB kept "
+            f"for {len(built)} cards ({size / len(built):.0f} B each)"
+        )
+        del built
+
+
+def _legacy_bucketing(cards):
+    """The old organize_photos_by_user + max-three loop, kept for comparison."""
+    valid_photos = {category: [] for category in TAXON_CATEGORIES}
+    unvalidated_photos = {}
+    for record, group in cards:
+        if group is not None:
+            valid_photos[group].append(record)
+        else:
+            for cat in record.validation_categories:
+                unvalidated_photos.setdefault(cat, []).append(record)
+
+    user_photos = defaultdict(
+        lambda: {"validated": defaultdict(list), "unvalidated": defaultdict(list)}
+    )
+    for category, photos in valid_photos.items():
+        for photo in photos:
+            user_photos[photo.author]["validated"][category].append(photo)
+    for category, photos in unvalidated_photos.items():
+        for photo in photos:
+            user_photos[photo.author]["unvalidated"][category].append(photo)
+    user_photos = dict(sorted(user_photos.items()))
+
+    for tcat in TAXON_CATEGORIES:
+        for user, buckets in user_photos.items():
+            validated = buckets["validated"][tcat]
+            if len(validated) > 3:
+                buckets["unvalidated"]["more-than-three"].extend(validated[3:])
+                buckets["validated"][tcat] = validated[:3]
+    return user_photos
+
+
+def _single_pass_bucketing(cards):
+    user_buckets = UserBuckets()
+    for record, group in cards:
+        user_buckets.add(record, group)
+    return user_buckets.result()
+
+
+def _cards(observations, contest, taxa=None):
+    categories, groups = classify_batch(observations, contest, taxa=taxa)
+    return [
+        (
+            PhotoRecord.from_observation(obs, first_photo(obs), c),
+            g if "validated" in c else None,
+        )
+        for obs, c, g in zip(observations, categories, groups)
+        if first_photo(obs)
+    ]
+
+
+@cli.command()
+@click.option("--count", default=100000, help="Observations to turn into cards.")
+def bucketing(count):
+    """Time single-pass bucketing against the old pipeline.
+
+    tests/test_contest.py checks that both give the same result.
+    """
+    contest = CONTESTS[CURRENT_YEAR]
+    cards = _cards(synthetic_observations(count), contest)
+    for name, bucket in (("legacy", _legacy_bucketing), ("single-pass", _single_pass_bucketing)):
+        start = time.perf_counter()
+        bucket(cards)
+        click.echo(f"{name:>12}: {time.perf_counter() - start:.3f}s for {len(cards)} cards")
+
+
+def _mutate(observations, rng, share):
+    """Copy `observations` with about `share` of them edited, added or removed."""
+    mutated = []
+    for obs in observations:
+        roll = rng.random()
+        if roll >= share:
+            mutated.append(obs)
+        elif roll < share * 0.1:
+            continue  # deleted upstream
+        else:
+            obs = {**obs}
+            field = rng.choice(("grade", "agreements", "license", "date", "user", "order"))
+            if field == "grade":
+                obs["quality_grade"] = rng.choice(GRADES)
+            elif field == "agreements":
+                obs["num_identification_agreements"] = rng.randrange(4)
+            elif field == "license" and obs["photos"]:
+                obs["photos"] = [{**obs["photos"][0], "license_code": rng.choice(LICENSES)}]
+            elif field == "date":
+                obs["observed_on"] = None
+            elif field == "user":
+                obs["user"] = {"login": f"user{rng.randrange(1000)}"}
+            elif mutated:
+                mutated.insert(rng.randrange(len(mutated)), obs)
+                continue
+            mutated.append(obs)
+    extra = synthetic_observations(int(len(observations) * share * 0.1) + 1, rng.random())
+    next_id = max((obs["id"] for obs in observations), default=0) + 1
+    for n, obs in enumerate(extra):
+        obs["id"] = next_id + n  # new upstream
+    return mutated + extra
+
+
+@cli.command()
+@click.option("--trials", default=200, help="Random refreshes to compare on.")
+@click.option("--count", default=100000, help="Observations for the timing run.")
+@click.option("--share", default=0.01, help="Share of observations changed per refresh.")
+def delta(trials, count, share):
+    """Check delta rebuilds against full builds, then time a typical refresh."""
+    contest = CONTESTS[CURRENT_YEAR]
+    rng = random.Random(2)
+    for trial in range(trials):
+        # Few users, so caps, overflows and reorders are exercised often.
+        observations = synthetic_observations(rng.randrange(0, 150), seed=trial)
+        for obs in observations:
+            obs["user"] = {"login": f"user{rng.randrange(6)}"}
+        previous = patch_user_photos(observations, contest)[:2]
+        for _ in range(3):
+            observations = _mutate(observations, rng, rng.choice((0.02, 0.2, 1.0)))
+            user_photos, index, _ = patch_user_photos(observations, contest, previous)
+            if user_photos != build_user_photos(observations, contest):
+                raise click.ClickException(f"delta build differs on trial {trial}")
+            previous = user_photos, index
+    click.echo(f"{trials} random refresh sequences: identical results")
+
+    observations = synthetic_observations(count)
+    previous = patch_user_photos(observations, contest)[:2]
+    refreshed = _mutate(observations, rng, share)
+    start = time.perf_counter()
+    build_user_photos(refreshed, contest)
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    _, _, reclassified = patch_user_photos(refreshed, contest, previous)
+    patched = time.perf_counter() - start
+    click.echo(f"full build:  {full:.3f}s for {len(refreshed)} observations")
+    click.echo(
+        f"delta build: {patched:.3f}s, {reclassified} reclassified ({full / patched:.1f}x)"
+    )
+
+
+# ------------------------------------------------------------------
+# Stage suite
+# ------------------------------------------------------------------
+def _flask_app():
+    """The contest app, imported on first use from the current (scratch) directory."""
+    import app
+
+    return app.app
+
+
+def _gallery_api_app(snapshot):
+    """A test client of the gallery API serving `snapshot` for every contest."""
+    import gallery_api
+    import thumbnails
+
+    api_app = Flask(__name__)
+    api_app.config["THUMBNAIL_DIR"] = tempfile.mkdtemp()
+    api_app.config["THUMBNAIL_CACHE_MB"] = 1
+    thumbnails.init_app(api_app, set)
+    gallery_api.init_app(api_app, lambda contest: snapshot)
+    return api_app.test_client()
+
+
+def _cards_of(user_photos):
+    return sum(
+        len(records)
+        for buckets in user_photos.values()
+        for categories in buckets.values()
+        for records in categories.values()
+    )
+
+
+def stage_timings(size, raw, contest, stages):
+    """Yield `(stage, seconds, items)` for each selected stage on `raw` observations.
+
+    Past the fetch, stages see what the app does: slim observations whose
+    taxa come from the (here in-memory) taxon store.
+    """
+    slim = [slim_observation(obs) for obs in raw]
+    taxa = {obs["taxon"]["id"]: taxon_record(obs["taxon"]) for obs in raw}
+    if "fetch_threaded" in stages:
+        with StubAPI(raw) as stub:
+            client = INatClient(base_url=stub.url, rate=1e9, burst=1e9)
+            start = time.perf_counter()
+            fetched = [slim_observation(o) for o in client.iter_project_observations("x")]
+            yield "fetch_threaded", time.perf_counter() - start, len(fetched)
+    if "fetch_async" in stages:
+        with StubAPI(raw) as stub:
+            client = AsyncINatClient(base_url=stub.url, rate=1e9, burst=1e9)
+            start = time.perf_counter()
+            fetched = client.fetch_project_observations_sync(
+                "x", transform=slim_observation
+            )
+            yield "fetch_async", time.perf_counter() - start, len(fetched)
+    if "classify_per_observation" in stages:
+        start = time.perf_counter()
+        for obs in slim:
+            if "validated" in get_validation_categories(obs, contest):
+                categorize_photo(obs, contest, taxa)
+        yield "classify_per_observation", time.perf_counter() - start, size
+    if "classify_batch" in stages:
+        start = time.perf_counter()
+        date_cache = {}
+        for page in iter_pages(slim):
+            classify_batch(page, contest, date_cache, taxa)
+        yield "classify_batch", time.perf_counter() - start, size
+    if "bucketing" in stages:
+        cards = _cards(slim, contest, taxa)
+        start = time.perf_counter()
+        _single_pass_bucketing(cards)
+        yield "bucketing", time.perf_counter() - start, len(cards)
+
+    user_photos = build_user_photos(slim, contest, taxa)
+    for year in (2024, 2025):
+        stage = f"render_index_{year}"
+        if stage not in stages:
+            continue
+        flask_app = _flask_app()
+        with flask_app.test_request_context():
+            # Compile the template first; the app renders from a warm cache.
+            render_template(CONTESTS[year].template, user_photos={}, datetime=datetime)
+            start = time.perf_counter()
+            render_template(
+                CONTESTS[year].template, user_photos=user_photos, datetime=datetime
+            )
+            yield stage, time.perf_counter() - start, _cards_of(user_photos)
+    if "gallery_api_2026" in stages:
+        # The 2026 page is a shell that fills itself from the JSON API: time
+        # the index build plus a client paging through every user's photos.
+        client = _gallery_api_app({"version": "bench", "user_photos": user_photos})
+        start = time.perf_counter()
+        cursor = ""
+        while cursor is not None:
+            page = client.get(f"/api/2026/users?limit=500&cursor={cursor}").get_json()
+            for entry in page["users"]:
+                photos_cursor = ""
+                while photos_cursor is not None:
+                    photos = client.get(
+                        f"/api/2026/users/{quote(entry['user'])}/photos"
+                        f"?limit=500&cursor={photos_cursor}"
+                    ).get_json()
+                    photos_cursor = photos["next"]
+            cursor = page["next"]
+        yield "gallery_api_2026", time.perf_counter() - start, _cards_of(user_photos)
+
+    if "evaluate_upserts" in stages or "evaluate_reads" in stages:
+        import judging
+
+        flask_app = _flask_app()
+        judges = [f"judge{j}" for j in range(10)]
+        with flask_app.app_context():
+            judging.db.drop_all()
+            judging.db.create_all()
+            if "evaluate_upserts" in stages:
+                upserts = min(size, 2000)  # one commit each, like /evaluate
+                start = time.perf_counter()
+                for i in range(upserts):
+                    judging.upsert_evaluation(judges[i % 10], i // 10, 3, 4, 5)
+                yield "evaluate_upserts", time.perf_counter() - start, upserts
+            if "evaluate_reads" in stages:
+                judging.db.session.execute(judging.db.delete(judging.Evaluation))
+                judging.db.session.execute(
+                    judging.db.insert(judging.Evaluation),
+                    [
+                        {
+                            "inat_username": judges[i % 10],
+                            "observation_id": i // 10,
+                            "wikipedia_score": i % 5 + 1,
+                            "science_score": i % 3 + 1,
+                            "photographic_score": i % 4 + 1,
+                            "total_score": i % 5 + i % 3 + i % 4 + 3,
+                        }
+                        for i in range(size)
+                    ],
+                )
+                judging.rebuild_scores()  # moves the version: the reads below miss
+                start = time.perf_counter()
+                judging.evaluation_stats.counts()
+                judging.evaluation_stats.judged(judges[0])
+                judging.leaderboard.rows()
+                yield "evaluate_reads", time.perf_counter() - start, size
+
+
+STAGES = (
+    "fetch_threaded",
+    "fetch_async",
+    "classify_per_observation",
+    "classify_batch",
+    "bucketing",
+    "render_index_2024",
+    "render_index_2025",
+    "gallery_api_2026",
+    "evaluate_upserts",
+    "evaluate_reads",
+)
+
+
+def mix_options(command):
+    """The fixture-mix options shared by `fixtures` and `suite`."""
+    for option in reversed(
+        (
+            click.option("--seed", default=0, help="Random seed of the fixtures."),
+            click.option("--year", default=CURRENT_YEAR, help="Contest window to use."),
+            click.option("--licenses", help='Licence weights, e.g. "cc-by=5,none=1".'),
+            click.option("--grades", help='Grade weights, e.g. "research=6,needs_id=3".'),
+            click.option("--taxa", help='Taxon-group weights, e.g. "vertebrates=2".'),
+            click.option("--in-window", type=float, help="Share of dates in the window."),
+        )
+    ):
+        command = option(command)
+    return command
+
+
+def build_mix(licenses, grades, taxa, in_window):
+    mix = {}
+    for key, text in (("licenses", licenses), ("grades", grades), ("taxa", taxa)):
+        if text:
+            mix[key] = parse_weights(text)
+    if in_window is not None:
+        mix["in_window"] = in_window
+    return mix
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@cli.command()
+@click.option("--count", default=1000, help="Observations to generate.")
+@click.option("--per-page", default=200, help="Observations per API page.")
+@click.option("--out", default="fixtures", help="Directory to write the pages to.")
+@mix_options
+def fixtures(count, per_page, out, seed, year, licenses, grades, taxa, in_window):
+    """Write synthetic /v1/observations response pages as JSON files."""
+    mix = build_mix(licenses, grades, taxa, in_window)
+    observations = synthetic_observations(count, seed, year, mix, raw=True)
+    os.makedirs(out, exist_ok=True)
+    pages = api_pages(observations, per_page)
+    for page in pages:
+        with open(os.path.join(out, f"page-{page['page']:04d}.json"), "w") as f:
+            json.dump(page, f)
+    click.echo(f"{count} observations in {len(pages)} pages under {out}/")
+
+
+@cli.command()
+@click.option("--sizes", default="1000,10000,100000", help="Observation counts to run.")
+@click.option("--stages", default=",".join(STAGES), help="Comma-separated stages to run.")
+@click.option("--output", default="bench-results.json", help="Where to write the results.")
+@mix_options
+def suite(sizes, stages, output, seed, year, licenses, grades, taxa, in_window):
+    """Time every pipeline stage on its own, at each size, into a JSON file."""
+    stages = stages.split(",")
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise click.BadParameter(", ".join(sorted(unknown)), param_hint="--stages")
+    mix = build_mix(licenses, grades, taxa, in_window)
+    output = os.path.abspath(output)
+    contest = CONTESTS[year]
+    results = []
+
+    # The app keeps its caches and evaluations.db under the working directory.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for size in sorted(int(n) for n in sizes.split(",")):
+                raw = synthetic_observations(size, seed, year, mix, raw=True)
+                for stage, seconds, items in stage_timings(size, raw, contest, stages):
+                    results.append(
+                        {
+                            "stage": stage,
+                            "size": size,
+                            "seconds": round(seconds, 6),
+                            "items": items,
+                            "us_per_item": round(seconds / max(items, 1) * 1e6, 3),
+                        }
+                    )
+                    click.echo(
+                        f"{stage:>26} {size:>7}: {seconds:8.3f}s "
+                        f"({results[-1]['us_per_item']:.1f} µs per item)"
+                    )
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "format": 1,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "year": year,
+        "mix": {**DEFAULT_MIX, **mix},
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    click.echo(f"Results written to {output}")
+
+
+@cli.command()
+@click.argument("baseline", type=click.File())
+@click.argument("current", type=click.File())
+@click.option("--threshold", default=0.10, help="Slowdown that counts as a regression.")
+def compare(baseline, current, threshold):
+    """Compare two suite result files; fail if any stage got slower than allowed."""
+    before = {(r["stage"], r["size"]): r for r in json.load(baseline)["results"]}
+    regressions = 0
+    for result in json.load(current)["results"]:
+        old = before.get((result["stage"], result["size"]))
+        if old is None:
+            continue
+        ratio = result["us_per_item"] / max(old["us_per_item"], 1e-9)
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        click.echo(
+            f"{result['stage']:>26} {result['size']:>7}: "
+            f"{old['us_per_item']:10.1f} -> {result['us_per_item']:10.1f} µs "
+            f"({ratio:5.2f}x){flag}"
+        )
+    if regressions:
+        raise click.ClickException(f"{regressions} stage(s) regressed")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,526 @@
+"""Contest years and the classification core they share.
+
+Every edition of the contest is one row in `CONTESTS`: its iNaturalist
+project, the window photos must fall in, the gallery template, how photos
+are split into taxon groups, and whether the edition is frozen (finished:
+served from its snapshot only, never refreshed from the API).
+"""
+import time
+from array import array
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import islice
+from typing import NamedTuple
+
+from metrics import histogram
+
+VERTEBRATES = ["Mammalia", "Aves", "Reptilia", "Amphibia", "Actinopterygii"]
+ARTHROPODS = ["Insecta", "Arachnida", "Crustacea", "Myriapoda"]
+
+COMPATIBLE_LICENSES = {"cc-by", "cc-by-sa", "cc0"}
+TAXON_CATEGORIES = ("vertebrates", "arthropods", "others")
+MAX_PER_CATEGORY = 3  # validated photos per user and taxon category
+
+BUILD_SECONDS = histogram(
+    "gallery_build_seconds", "Time per gallery build, by stage.", ("stage",)
+)
+
+
+class Contest:
+    def __init__(self, year, start, end, taxon_rule="ancestors", frozen=False):
+        self.year = year
+        self.project_slug = f"wikiconcurso-fotografico-inaturalist-{year}"
+        self.template = f"index_{year}.html"
+        self.valid_start_date = datetime.strptime(start, "%Y-%m-%d")
+        self.valid_end_date = datetime.strptime(end, "%Y-%m-%d")
+        self.taxon_rule = taxon_rule  # "ancestors" or "iconic"
+        self.frozen = frozen
+
+
+CONTESTS = {
+    contest.year: contest
+    for contest in (
+        Contest(2024, "2023-09-01", "2024-07-31", taxon_rule="iconic", frozen=True),
+        Contest(2025, "2024-09-01", "2025-07-31", frozen=True),
+        Contest(2026, "2025-08-01", "2026-08-31"),
+    )
+}
+CURRENT_YEAR = max(CONTESTS)
+
+_BY_SLUG = {contest.project_slug: contest for contest in CONTESTS.values()}
+
+
+def contest_for_slug(project_slug):
+    return _BY_SLUG[project_slug]
+
+
+# ------------------------------------------------------------------
+# Classification
+# ------------------------------------------------------------------
+def first_photo(observation):
+    """Return the first photo-dict or None if none/invalid."""
+    photos = observation.get("photos") or []
+    return photos[0] if photos and isinstance(photos[0], dict) else None
+
+
+def is_valid_date(observed_date: str | None, contest: Contest) -> bool:
+    """Return True iff the date string exists & falls inside the contest window."""
+    if not observed_date:
+        return False
+    try:
+        date_str = observed_date.split("T")[0]  # handle ISO strings
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+        return contest.valid_start_date <= date <= contest.valid_end_date
+    except ValueError:
+        return False
+
+
+def resolve_taxon(observation, taxa=None):
+    """The observation's taxon, as stored in `taxa` (id -> taxon) when known there."""
+    taxon = observation.get("taxon") or {}
+    if taxa is not None:
+        return taxa.get(taxon.get("id"), taxon)
+    return taxon
+
+
+def categorize_photo(observation, contest, taxa=None):
+    """The observation's taxon category under `contest`'s rule (see `_taxon_group`)."""
+    return _GROUPS[_taxon_group(resolve_taxon(observation, taxa), contest)]
+
+
+def get_validation_categories(observation, contest):
+    """Return a list of validation flags for a single observation."""
+    categories = []
+
+    photo_obj = first_photo(observation)
+    if photo_obj is None:
+        categories.append("no-photo")
+        return categories
+
+    if not is_valid_date(observation.get("observed_on"), contest):
+        categories.append("date-before-september")
+
+    if photo_obj.get("license_code") not in COMPATIBLE_LICENSES:
+        categories.append("non-compatible-license")
+
+    if observation.get("quality_grade") != "research":
+        categories.append("non-research-grade")
+        # “needs_id” fast-track
+        taxon_rank = (observation.get("taxon") or {}).get("rank", "")
+        if (
+            observation.get("quality_grade") == "needs_id"
+            and is_valid_date(observation.get("observed_on"), contest)
+            and photo_obj.get("license_code") in COMPATIBLE_LICENSES
+            and observation.get("num_identification_agreements", 0) >= 2
+            and taxon_rank == "genus"
+        ):
+            categories.append("validated")
+
+    if not categories:
+        categories.append("validated")
+
+    return categories
+
+
+def validate_observation(observation, contest):
+    """Check if an observation is valid based on date, license, and research grade."""
+    return "validated" in get_validation_categories(observation, contest)
+
+
+@lru_cache(maxsize=4096)
+def display_date(observed_on):
+    """Return an observation date as YYYY-MM-DD for the cards, or None if unknown."""
+    try:
+        return datetime.fromisoformat(observed_on).strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+_shared_categories = {}
+
+
+class PhotoRecord(NamedTuple):
+    """One gallery card: just the fields the templates read, ready to render.
+
+    A tuple, so it is immutable, has no per-instance dict and serialises to
+    a JSON array in snapshots.
+    """
+
+    observation_id: int
+    photo_id: int | None
+    photo_url: str | None  # medium size, as shown on the card
+    author: str
+    date: str | None  # YYYY-MM-DD, parsed once here rather than in the template
+    license: str
+    species: str | None
+    validation_categories: tuple
+
+    @classmethod
+    def from_observation(cls, obs, photo, validation_categories):
+        url = photo.get("url")
+        return cls(
+            obs.get("id") or "",
+            photo.get("id"),
+            url.replace("square", "medium") if url else None,
+            (obs.get("user") or {}).get("login", "Unknown"),
+            display_date(obs.get("observed_on", "Unknown")),
+            photo.get("license_code", ""),
+            (obs.get("taxon") or {}).get("name", "Unknown"),
+            validation_categories,
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuild a record from its JSON array, sharing equal category tuples."""
+        categories = tuple(row[-1])
+        categories = _shared_categories.setdefault(categories, categories)
+        return cls(*row[:-1], categories)
+
+
+class UserBuckets:
+    """Per-user gallery buckets, filled in one pass as photos are classified.
+
+    A user's first `cap` validated photos in each taxon category are kept;
+    later ones go to the "more-than-three" unvalidated bucket, grouped by
+    taxon category in `TAXON_CATEGORIES` order.
+    """
+
+    def __init__(self, cap=MAX_PER_CATEGORY):
+        self.cap = cap
+        self._users = {}
+        self._overflow = {}
+
+    def add(self, record, taxon_category=None):
+        """Add a validated record to `taxon_category`, or an unvalidated one (None)."""
+        buckets = self._users.get(record.author)
+        if buckets is None:
+            buckets = self._users[record.author] = {
+                "validated": {category: [] for category in TAXON_CATEGORIES},
+                "unvalidated": {},
+            }
+
+        if taxon_category is None:
+            unvalidated = buckets["unvalidated"]
+            for category in record.validation_categories:
+                if category in unvalidated:
+                    unvalidated[category].append(record)
+                else:
+                    unvalidated[category] = [record]
+            return
+
+        validated = buckets["validated"][taxon_category]
+        if len(validated) < self.cap:
+            validated.append(record)
+            return
+        overflow = self._overflow.get(record.author)
+        if overflow is None:
+            overflow = self._overflow[record.author] = {
+                category: [] for category in TAXON_CATEGORIES
+            }
+        overflow[taxon_category].append(record)
+
+    def result(self):
+        """Return {user: {"validated": ..., "unvalidated": ...}}, users in alphabetic order."""
+        for user, overflow in self._overflow.items():
+            self._users[user]["unvalidated"]["more-than-three"] = [
+                record for category in TAXON_CATEGORIES for record in overflow[category]
+            ]
+        self._overflow = {}
+        return dict(sorted(self._users.items()))
+
+
+# ------------------------------------------------------------------
+# Batch classification
+# ------------------------------------------------------------------
+# Validation flags, one bit each; a page's flags live in one array("B").
+NO_PHOTO = 1
+BAD_DATE = 2
+BAD_LICENSE = 4
+NOT_RESEARCH = 8
+FAST_TRACK = 16  # needs_id, two agreements, genus rank
+
+GRADES = {"research": 0, "needs_id": 1}  # anything else: 2
+_GROUPS = TAXON_CATEGORIES  # index = taxon group code
+
+
+def _date_ordinal(observed_date, cache):
+    """Proleptic ordinal of a date string (0 if missing/invalid), memoised per string."""
+    try:
+        return cache[observed_date]
+    except (KeyError, TypeError):
+        pass
+    ordinal = 0
+    if observed_date and isinstance(observed_date, str):
+        date_str = observed_date.split("T")[0]
+        try:
+            if len(date_str) == 10 and date_str[4] == date_str[7] == "-":
+                ordinal = date.fromisoformat(date_str).toordinal()
+            else:
+                ordinal = datetime.strptime(date_str, "%Y-%m-%d").toordinal()
+        except ValueError:
+            ordinal = 0
+        cache[observed_date] = ordinal
+    return ordinal
+
+
+class ObservationColumns:
+    """A page of observations as parallel columns, one entry per observation."""
+
+    def __init__(self, observations, contest, date_cache=None, taxa=None):
+        date_cache = {} if date_cache is None else date_cache
+        self.has_photo = array("B")
+        self.date_ordinal = array("l")
+        self.compatible_license = array("B")
+        self.grade = array("B")
+        self.agreements = array("l")
+        self.genus = array("B")
+        self.group = array("B")
+
+        for obs in observations:
+            photo = first_photo(obs)
+            taxon = obs.get("taxon") or {}
+            self.has_photo.append(photo is not None)
+            self.date_ordinal.append(_date_ordinal(obs.get("observed_on"), date_cache))
+            self.compatible_license.append(
+                photo is not None and photo.get("license_code") in COMPATIBLE_LICENSES
+            )
+            self.grade.append(GRADES.get(obs.get("quality_grade"), 2))
+            self.agreements.append(obs.get("num_identification_agreements") or 0)
+            self.genus.append(taxon.get("rank") == "genus")
+            self.group.append(_taxon_group(resolve_taxon(obs, taxa), contest))
+
+    def __len__(self):
+        return len(self.has_photo)
+
+
+def _taxon_group(taxon, contest):
+    if contest.taxon_rule == "iconic":
+        iconic_taxon = taxon.get("iconic_taxon_name", "")
+        return 0 if iconic_taxon in VERTEBRATES else 1 if iconic_taxon in ARTHROPODS else 2
+    ancestor_ids = taxon.get("ancestor_ids") or ()
+    return 0 if 355675 in ancestor_ids else 1 if 47120 in ancestor_ids else 2
+
+
+def classify_columns(columns, contest):
+    """Compute the validation flags of every observation in `columns`."""
+    start = contest.valid_start_date.toordinal()
+    end = contest.valid_end_date.toordinal()
+    bad_date = [0 if start <= d <= end else BAD_DATE for d in columns.date_ordinal]
+    bad_license = [0 if ok else BAD_LICENSE for ok in columns.compatible_license]
+    not_research = [0 if g == 0 else NOT_RESEARCH for g in columns.grade]
+    fast_track = [
+        FAST_TRACK if g == 1 and a >= 2 and genus else 0
+        for g, a, genus in zip(columns.grade, columns.agreements, columns.genus)
+    ]
+    return array(
+        "B",
+        (
+            date_flag | license_flag | grade_flag | fast_flag if photo else NO_PHOTO
+            for photo, date_flag, license_flag, grade_flag, fast_flag in zip(
+                columns.has_photo, bad_date, bad_license, not_research, fast_track
+            )
+        ),
+    )
+
+
+def _categories_for_flags(flags):
+    """Translate a flag set into the lists `get_validation_categories` returns."""
+    if flags & NO_PHOTO:
+        return ["no-photo"]
+    categories = []
+    if flags & BAD_DATE:
+        categories.append("date-before-september")
+    if flags & BAD_LICENSE:
+        categories.append("non-compatible-license")
+    if flags & NOT_RESEARCH:
+        categories.append("non-research-grade")
+        if flags & FAST_TRACK and not flags & (BAD_DATE | BAD_LICENSE):
+            categories.append("validated")
+    if not categories:
+        categories.append("validated")
+    return categories
+
+
+# At most 32 flag combinations: translate each once, share the lists.
+CATEGORIES_BY_FLAGS = [tuple(_categories_for_flags(flags)) for flags in range(32)]
+
+
+def classify_batch(observations, contest, date_cache=None, taxa=None):
+    """Classify a page of observations at once.
+
+    Returns `(categories, groups)`: per observation, the same flags as
+    `get_validation_categories` (as shared tuples) and its taxon category.
+    Taxa found in `taxa` (id -> taxon, see `taxa.TaxonStore.lookup`) are
+    grouped by their stored ancestry rather than the observation's copy.
+    """
+    columns = ObservationColumns(observations, contest, date_cache, taxa)
+    flags = classify_columns(columns, contest)
+    return (
+        [CATEGORIES_BY_FLAGS[f] for f in flags],
+        [_GROUPS[g] for g in columns.group],
+    )
+
+
+def iter_pages(observations, size=200):
+    """Split any iterable of observations into lists of at most `size`."""
+    iterator = iter(observations)
+    while page := list(islice(iterator, size)):
+        yield page
+
+
+def build_user_photos(observations, contest, taxa=None):
+    """Classify observations and bucket them per user.
+
+    `observations` may be any iterable, including the live page stream from
+    `iter_project_observations`, so classification overlaps the download.
+    Each page is classified in one batch by `classify_batch` and its records
+    go straight into their user's buckets.  `taxa` is passed on to it.
+    """
+    user_buckets = UserBuckets()
+    date_cache = {}
+    classifying = bucketing = 0.0  # time spent, not counting the pages' arrival
+
+    for page in iter_pages(observations):
+        start = time.perf_counter()
+        page_categories, page_groups = classify_batch(page, contest, date_cache, taxa)
+        classified = time.perf_counter()
+        for obs, categories, group in zip(page, page_categories, page_groups):
+            photo = first_photo(obs)
+            if photo is None:
+                continue  # nothing to show
+
+            record = PhotoRecord.from_observation(obs, photo, categories)
+            user_buckets.add(record, group if "validated" in categories else None)
+        classifying += classified - start
+        bucketing += time.perf_counter() - classified
+
+    start = time.perf_counter()
+    user_photos = user_buckets.result()
+    BUILD_SECONDS.observe(classifying, stage="classify")
+    BUILD_SECONDS.observe(bucketing + time.perf_counter() - start, stage="bucket")
+    return user_photos
+
+
+# ------------------------------------------------------------------
+# Delta builds
+# ------------------------------------------------------------------
+def observation_fingerprint(obs, contest, taxa=None):
+    """Every input of an observation's card and classification, as a JSON-ready list.
+
+    The taxon enters as its category under `contest`'s rule, so a change in
+    the stored ancestry is seen without keeping the ancestry itself.  The
+    author comes second and whether there is a photo last (see
+    `patch_user_photos`).
+    """
+    photo = first_photo(obs)
+    taxon = obs.get("taxon") or {}
+    if photo is None:
+        photo = {}
+    return [
+        _taxon_group(resolve_taxon(obs, taxa), contest),
+        (obs.get("user") or {}).get("login", "Unknown"),
+        obs.get("observed_on"),
+        obs.get("quality_grade"),
+        obs.get("num_identification_agreements"),
+        taxon.get("id"),
+        taxon.get("name"),
+        taxon.get("rank"),
+        photo.get("id"),
+        photo.get("url"),
+        photo.get("license_code"),
+        bool(photo),
+    ]
+
+
+def patch_user_photos(observations, contest, previous=None, taxa=None):
+    """`build_user_photos`, reclassifying only the observations that changed.
+
+    `previous` is the `(user_photos, index)` pair an earlier call returned
+    (or None for a full build).  The index holds each observation's
+    fingerprint and taxon category and each user's observation ids in
+    order; an observation whose fingerprint is unchanged keeps its record,
+    and only users whose photos or their order changed are re-bucketed and
+    re-capped, the others keeping their buckets as they are.  Returns
+    `(user_photos, index, reclassified)`, identical to a full build.
+
+    Like `build_user_photos` it takes any iterable, so the changed
+    observations of a live page stream are classified as the pages arrive.
+    """
+    rules = [contest.year, str(contest.valid_start_date), str(contest.valid_end_date)]
+    rules.append(contest.taxon_rule)
+    if previous is None or previous[1].get("rules") != rules:
+        previous = ({}, {"ids": [], "fingerprints": [], "groups": [], "users": {}})
+    old_photos, old_index = previous
+    old_positions = dict(zip(old_index["ids"], range(len(old_index["ids"]))))
+    old_fingerprints = old_index["fingerprints"]
+    old_groups = old_index["groups"]
+
+    ids, fingerprints, groups = [], [], []
+    user_ids = {}
+    fresh = {}  # id -> record, for the changed observations with a photo
+    date_cache = {}
+    reclassified = 0
+    classifying = 0.0  # time spent, not counting the pages' arrival
+
+    for page in iter_pages(observations):
+        start = time.perf_counter()
+        changed = []  # (position, observation) of the new or edited ones
+        for obs in page:
+            obs_id = obs.get("id")
+            fingerprint = observation_fingerprint(obs, contest, taxa)
+            old = old_positions.get(obs_id)
+            if old is None or old_fingerprints[old] != fingerprint:
+                changed.append((len(ids), obs))
+                groups.append(None)  # filled in below
+            else:
+                groups.append(old_groups[old])
+            ids.append(obs_id)
+            fingerprints.append(fingerprint)
+            if fingerprint[-1]:  # has a photo, so a card
+                user_ids.setdefault(fingerprint[1], []).append(obs_id)
+
+        if changed:
+            changed_obs = [obs for _, obs in changed]
+            categories, page_groups = classify_batch(
+                changed_obs, contest, date_cache, taxa
+            )
+            for (i, obs), c, g in zip(changed, categories, page_groups):
+                groups[i] = g if "validated" in c else None
+                photo = first_photo(obs)
+                if photo is not None:
+                    fresh[obs.get("id")] = PhotoRecord.from_observation(obs, photo, c)
+            reclassified += len(changed)
+        classifying += time.perf_counter() - start
+    classified = time.perf_counter()
+
+    # Users with a changed photo, or who gained, lost or reordered photos.
+    old_users = old_index["users"]
+    affected = {record.author for record in fresh.values()}
+    affected.update(user for user, ids in user_ids.items() if old_users.get(user) != ids)
+
+    records = {}
+    for user in affected & old_photos.keys():
+        for categories in old_photos[user].values():
+            for category_records in categories.values():
+                for record in category_records:
+                    records[record.observation_id] = record
+    records.update(fresh)
+    group_of = dict(zip(ids, groups))
+
+    user_buckets = UserBuckets()
+    for user in affected & user_ids.keys():
+        for obs_id in user_ids[user]:
+            user_buckets.add(records[obs_id], group_of[obs_id])
+    user_photos = {user: old_photos[user] for user in user_ids.keys() - affected}
+    user_photos.update(user_buckets.result())
+
+    BUILD_SECONDS.observe(classifying, stage="classify")
+    BUILD_SECONDS.observe(time.perf_counter() - classified, stage="bucket")
+    index = {
+        "rules": rules,
+        "ids": ids,
+        "fingerprints": fingerprints,
+        "groups": groups,
+        "users": user_ids,
+    }
+    return dict(sorted(user_photos.items())), index, reclassified
@@ -0,0 +1,140 @@
+"""In-memory judging queue backed by a per-project JSON file.
+
+The file is parsed once and kept as a list, looked up by position.
+`refresh()` only costs an `os.stat` unless the file changed, so serving
+the current entry needs no JSON parsing per request.  The file itself is
+built off-request, by a background thread or the CLI, and written
+atomically.  A failed background build is remembered and not retried
+until a backoff, doubling with each consecutive failure, has passed.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from obs_cache import write_json_atomic
+
+INTERNED_FIELDS = ("author", "license", "species")
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by `obj` and everything it references."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+class EvaluationQueue:
+    def __init__(self, path, build, logger=None, retry_after=60, max_retry_after=1800):
+        """`build()` must return the list of queue entries; it may raise.
+
+        After a failed background build the next one waits `retry_after`
+        seconds, doubled per consecutive failure up to `max_retry_after`.
+        """
+        self.path = path
+        self.build = build
+        self.logger = logger or logging.getLogger(__name__)
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.last_error = None  # message of the last failed build, until one succeeds
+        self.failed_at = None
+        self._failures = 0
+        self._items = []
+        self._version = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def refresh(self):
+        """Reload the queue if the file changed (or vanished) since the last load."""
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+        if version == self._version:
+            return
+
+        with self._lock:
+            if version == self._version:
+                return
+            items = []
+            if version is not None:
+                with open(self.path, "r") as f:
+                    items = json.load(f)
+                for item in items:
+                    for field in INTERNED_FIELDS:
+                        if isinstance(item.get(field), str):
+                            item[field] = sys.intern(item[field])
+            self._items = items
+            self._version = version
+
+        if version is not None:
+            self.logger.info(
+                f"Loaded judging queue {self.path}: {len(items)} entries, "
+                f"~{self.memory_bytes() / 1024:.0f} KiB in memory"
+            )
+
+    @property
+    def building(self):
+        return self._building
+
+    @property
+    def exists(self):
+        return self._version is not None
+
+    def retry_in(self):
+        """Seconds before a failed build may be retried (0 if it may run now)."""
+        if not self._failures:
+            return 0
+        backoff = self.retry_after * 2 ** (self._failures - 1)
+        backoff = min(backoff, self.max_retry_after)
+        return max(0, self.failed_at + backoff - time.time())
+
+    def rebuild(self):
+        """Build the queue file now and load it; return the number of entries."""
+        items = self.build()
+        write_json_atomic(self.path, items)
+        self.refresh()
+        return len(items)
+
+    def rebuild_in_background(self):
+        """Start a build thread unless one is running or a failed one is backing off."""
+        with self._lock:
+            if self._building or self.retry_in():
+                return
+            self._building = True
+
+        def run():
+            try:
+                self.rebuild()
+                self.last_error, self.failed_at, self._failures = None, None, 0
+            except Exception as e:
+                self.logger.error(f"Failed to build judging queue {self.path}: {e}")
+                self.last_error, self.failed_at = str(e), time.time()
+                self._failures += 1
+            finally:
+                self._building = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def memory_bytes(self):
+        """Approximate memory held by the loaded queue."""
+        return deep_size(self._items)
@@ -0,0 +1,219 @@
+"""JSON gallery API: the user list, one user's photos, photos by category.
+
+Registered on the contest app with `init_app(app, get_snapshot)`.  Every
+endpoint reads the precomputed gallery snapshot, so a request costs one
+slice of an index built once per snapshot version, whatever the size of
+the contest.  Lists are paginated with opaque cursors; a cursor is only
+valid for the snapshot version it was issued for, and a client holding
+one from an older version gets a 409 and starts over.
+"""
+import base64
+import threading
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from contest import CONTESTS, TAXON_CATEGORIES
+from metrics import cache_result
+from thumbnails import thumbnail_url
+
+bp = Blueprint("gallery_api", __name__, url_prefix="/api")
+
+UNVALIDATED_CATEGORIES = (
+    "date-before-september",
+    "non-compatible-license",
+    "non-research-grade",
+    "more-than-three",
+)
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class GalleryIndex:
+    """Flat, ordered views of one snapshot's per-user buckets."""
+
+    def __init__(self, snapshot):
+        self.version = snapshot["version"]
+        self.users = []
+        self.user_photos = {}
+        self.by_category = {
+            category: [] for category in (*TAXON_CATEGORIES, *UNVALIDATED_CATEGORIES)
+        }
+        for user, buckets in snapshot["user_photos"].items():
+            photos = []
+            for kind, categories in (
+                ("validated", TAXON_CATEGORIES),
+                ("unvalidated", UNVALIDATED_CATEGORIES),
+            ):
+                for category in categories:
+                    for record in buckets[kind].get(category, ()):
+                        photos.append((kind, category, record))
+                        self.by_category[category].append((kind, category, record))
+            self.users.append(
+                {
+                    "user": user,
+                    "validated": {
+                        category: len(buckets["validated"].get(category, ()))
+                        for category in TAXON_CATEGORIES
+                    },
+                    "unvalidated": {
+                        category: len(buckets["unvalidated"].get(category, ()))
+                        for category in UNVALIDATED_CATEGORIES
+                    },
+                }
+            )
+            self.user_photos[user] = photos
+
+
+class GalleryIndexes:
+    """The `GalleryIndex` of each project's current snapshot version."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_slug, snapshot):
+        with self._lock:
+            index = self._indexes.get(project_slug)
+        if index is not None and index.version == snapshot["version"]:
+            cache_result("gallery_index", "hit")
+            return index
+        cache_result("gallery_index", "miss")
+        index = GalleryIndex(snapshot)
+        with self._lock:
+            self._indexes[project_slug] = index
+        return index
+
+
+def init_app(app, get_snapshot):
+    """Register the API on `app`.
+
+    `get_snapshot(contest)` must return the contest's current gallery
+    snapshot, building it if needed, or abort the request.
+    """
+    app.extensions["gallery_api"] = (get_snapshot, GalleryIndexes())
+    app.register_blueprint(bp)
+
+
+def gallery_index(year):
+    contest = CONTESTS.get(year)
+    if contest is None:
+        abort(404, description=f"No contest for {year}")
+    get_snapshot, indexes = current_app.extensions["gallery_api"]
+    return indexes.get(contest.project_slug, get_snapshot(contest))
+
+
+# ------------------------------------------------------------------
+# Pagination
+# ------------------------------------------------------------------
+def encode_cursor(version, offset):
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor, version):
+    """Return the offset `cursor` points at; 400 if malformed, 409 if stale."""
+    try:
+        cursor_version, offset = base64.urlsafe_b64decode(cursor).decode().split(":")
+        offset = int(offset)
+    except ValueError:
+        abort(400, description="Invalid cursor")
+    if offset < 0:
+        abort(400, description="Invalid cursor")
+    if cursor_version != version:
+        abort(409, description="The gallery changed; start again without a cursor")
+    return offset
+
+
+def paginate(items, version):
+    """Slice `items` by the request's `cursor` and `limit`; return (page, next)."""
+    limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+    if not 1 <= limit <= MAX_LIMIT:
+        abort(400, description=f"limit must be between 1 and {MAX_LIMIT}")
+    cursor = request.args.get("cursor")
+    offset = decode_cursor(cursor, version) if cursor else 0
+    end = offset + limit
+    return items[offset:end], encode_cursor(version, end) if end < len(items) else None
+
+
+def photo_json(kind, category, record):
+    return {
+        "kind": kind,
+        "category": category,
+        **record._asdict(),
+        "thumbnail_url": thumbnail_url(record.photo_url),
+    }
+
+
+def api_response(index, payload):
+    """JSON response, conditional on the snapshot version (same URL, same data)."""
+    response = jsonify(version=index.version, **payload)
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(index.version, weak=True)
+    return response.make_conditional(request)
+
+
+def category_arg(required=False):
+    category = request.args.get("category")
+    if category is None:
+        if required:
+            abort(400, description="category is required")
+        return None
+    if category not in (*TAXON_CATEGORIES, *UNVALIDATED_CATEGORIES):
+        abort(400, description=f"Unknown category: {category}")
+    return category
+
+
+# ------------------------------------------------------------------
+# Routes
+# ------------------------------------------------------------------
+@bp.errorhandler(HTTPException)
+def json_error(error):
+    return jsonify(error=error.description), error.code
+
+
+@bp.route("/<int:year>/users")
+def users(year):
+    """Participants in alphabetical order, with their photo counts per category."""
+    index = gallery_index(year)
+    page, next_cursor = paginate(index.users, index.version)
+    return api_response(
+        index, {"total": len(index.users), "users": page, "next": next_cursor}
+    )
+
+
+@bp.route("/<int:year>/users/<path:user>/photos")
+def user_photos(year, user):
+    """One participant's photos, validated first, optionally of one `category`."""
+    index = gallery_index(year)
+    if user not in index.user_photos:
+        abort(404, description=f"No photos by {user}")
+    photos = index.user_photos[user]
+    category = category_arg()
+    if category is not None:
+        photos = [photo for photo in photos if photo[1] == category]
+    page, next_cursor = paginate(photos, index.version)
+    return api_response(
+        index,
+        {
+            "user": user,
+            "total": len(photos),
+            "photos": [photo_json(*photo) for photo in page],
+            "next": next_cursor,
+        },
+    )
+
+
+@bp.route("/<int:year>/photos")
+def photos_by_category(year):
+    """Every participant's photos in one validation `category`, by participant."""
+    index = gallery_index(year)
+    photos = index.by_category[category_arg(required=True)]
+    page, next_cursor = paginate(photos, index.version)
+    return api_response(
+        index,
+        {
+            "total": len(photos),
+            "photos": [photo_json(*photo) for photo in page],
+            "next": next_cursor,
+        },
+    )
@@ -0,0 +1,236 @@
+"""iNaturalist API client shared by the contest apps.
+
+One pooled keep-alive session, a token bucket that keeps us under the API's
+rate limit (about one request per second), retries with jittered
+exponential backoff, and concurrent page fetching.  `base_url` is
+injectable so the client can be pointed at a local stub server.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import counter, histogram
+
+API_URL = "https://api.inaturalist.org/v1"
+USER_AGENT = "wikiconcurso-inaturalist (+https://github.com/lubianat/wikiconcurso-inaturalist)"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+REQUEST_SECONDS = histogram(
+    "inat_request_seconds",
+    "Time to get one iNaturalist API response, retries and rate limiting included.",
+    ("client", "endpoint"),
+)
+REQUEST_RETRIES = counter(
+    "inat_request_retries_total",
+    "Retried iNaturalist API requests.",
+    ("client", "endpoint"),
+)
+RESPONSE_BYTES = counter(
+    "inat_response_bytes_total",
+    "Bytes received from the iNaturalist API.",
+    ("client", "endpoint"),
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+class INatClient:
+    def __init__(
+        self,
+        base_url=API_URL,
+        max_workers=4,
+        rate=1.0,
+        burst=3,
+        max_retries=4,
+        backoff=1.0,
+        timeout=30,
+        session=None,
+        archive=None,
+        logger=None,
+    ):
+        """Pass a `page_archive.PageArchive` as `archive` to keep every page fetched."""
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.archive = archive
+        self.logger = logger or logging.getLogger(__name__)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+        self.session = session
+
+    def get_json(self, path, params):
+        """GET `path` with retries; raise `requests.RequestException` once they run out."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        labels = {"client": "threaded", "endpoint": api_endpoint(path)}
+        with REQUEST_SECONDS.time(**labels):
+            for attempt in range(self.max_retries + 1):
+                self.bucket.acquire()
+                try:
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                    RESPONSE_BYTES.inc(len(response.content), **labels)
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response.json()
+                    error = requests.HTTPError(
+                        f"{response.status_code} for {response.url}", response=response
+                    )
+                    delay = _retry_after(response)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error, delay = e, None
+
+                if attempt == self.max_retries:
+                    raise error
+                if delay is None:
+                    delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                REQUEST_RETRIES.inc(**labels)
+                self.logger.warning(
+                    f"Retrying {url} in {delay:.1f}s "
+                    f"({attempt + 1}/{self.max_retries}): {error}"
+                )
+                time.sleep(delay)
+
+    def iter_project_observations(self, project_slug, per_page=200):
+        """Yield every observation of a project, in the same order as a serial pager.
+
+        The first page tells us `total_results`; the remaining pages are then
+        fetched concurrently, at most `max_workers` ahead of the consumer, and
+        yielded in page order.  Memory therefore stays at a few pages however
+        big the project is, and the caller can classify one page while the
+        next ones download.  Any page that still fails after its retries
+        raises, rather than silently truncating the stream.  With an
+        `archive`, the fetch is recorded there and marked complete at the end.
+        """
+        fetch_id = self.archive.begin(project_slug) if self.archive else None
+
+        def fetch_page(page):
+            params = {
+                "project_id": project_slug,
+                "per_page": per_page,
+                "page": page,
+                "order_by": "observed_on",
+            }
+            data = self.get_json("observations", params)
+            if fetch_id is not None:
+                self.archive.append(fetch_id, page, data)
+            return data
+
+        first = fetch_page(1)
+        pages = math.ceil(first.get("total_results", 0) / per_page)
+        if pages <= 1:
+            yield from first.get("results", [])
+            if fetch_id is not None:
+                self.archive.finish(fetch_id)
+            return
+
+        remaining = iter(range(2, pages + 1))
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            window = deque(
+                executor.submit(fetch_page, page)
+                for page in islice(remaining, self.max_workers)
+            )
+            yield from first.pop("results", [])
+            while window:
+                data = window.popleft().result()
+                for page in islice(remaining, 1):
+                    window.append(executor.submit(fetch_page, page))
+                yield from data.get("results", [])
+            if fetch_id is not None:
+                self.archive.finish(fetch_id)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def slim_observation(observation):
+    """Project a raw API observation down to the fields the contest apps read.
+
+    Drops identifications, comments, every photo but the first and all of
+    the taxon but its id, name and rank (ancestry and the rest live in the
+    `taxa.TaxonStore`, so harvest raw records into it first).  The result has
+    the same shape as the raw record, so it feeds the same helpers and templates.
+    """
+    photos = observation.get("photos") or []
+    photo = photos[0] if photos and isinstance(photos[0], dict) else None
+    taxon = observation.get("taxon") or {}
+    user = observation.get("user") or {}
+    return {
+        "id": observation.get("id"),
+        "observed_on": observation.get("observed_on"),
+        "updated_at": observation.get("updated_at"),
+        "quality_grade": observation.get("quality_grade"),
+        "num_identification_agreements": observation.get(
+            "num_identification_agreements", 0
+        ),
+        "photos": [
+            {
+                "id": photo.get("id"),
+                "url": photo.get("url"),
+                "license_code": photo.get("license_code"),
+                "attribution": photo.get("attribution"),
+            }
+        ]
+        if photo
+        else [],
+        "user": {"login": user["login"]} if "login" in user else {},
+        "taxon": {
+            "id": taxon.get("id"),
+            "name": taxon.get("name"),
+            "rank": taxon.get("rank"),
+        }
+        if taxon
+        else {},
+    }
+
+
+def api_endpoint(path):
+    """The metrics label of an API path: "taxa/1,2,3" -> "taxa"."""
+    return path.strip("/").split("/", 1)[0]
+
+
+def _retry_after(response):
+    """Seconds from a numeric Retry-After header, or None to use our own backoff."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,251 @@
+"""Asyncio iNaturalist client for the refresh pipeline.
+
+Same contract as `inat.INatClient` (rate limit, retries with jittered
+backoff, serial-pager order, a failed page fails the fetch), but pages are
+awaited on one event loop instead of blocking a pool of threads.  Every
+request has its own timeout, a whole fetch can be given a deadline, and
+cancelling it cancels the pages in flight.  `fetch_project_observations_sync`
+and `iter_project_observations_sync` run a fetch from ordinary (Flask or CLI)
+code.
+"""
+import asyncio
+import logging
+import math
+import queue
+import random
+import threading
+from collections import deque
+from itertools import islice
+
+import aiohttp
+
+from inat import (
+    API_URL,
+    REQUEST_RETRIES,
+    REQUEST_SECONDS,
+    RESPONSE_BYTES,
+    RETRY_STATUSES,
+    USER_AGENT,
+    TokenBucket,
+    _retry_after,
+    api_endpoint,
+)
+
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class AsyncINatClient:
+    def __init__(
+        self,
+        base_url=API_URL,
+        max_workers=4,
+        rate=1.0,
+        burst=3,
+        max_retries=4,
+        backoff=1.0,
+        timeout=30,
+        bucket=None,
+        archive=None,
+        logger=None,
+    ):
+        """Pass the `bucket` of an `INatClient` to share one rate limit with it.
+
+        With a `page_archive.PageArchive` as `archive`, every page is kept there.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self.archive = archive
+        self.logger = logger or logging.getLogger(__name__)
+
+    def session(self):
+        """A keep-alive session with at most `max_workers` connections."""
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_workers),
+            headers={"User-Agent": USER_AGENT},
+            timeout=self.timeout,
+        )
+
+    async def get_json(self, http, path, params):
+        """GET `path` with retries; raise one of `FETCH_ERRORS` once they run out."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        labels = {"client": "async", "endpoint": api_endpoint(path)}
+        with REQUEST_SECONDS.time(**labels):
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(self.bucket.reserve())
+                try:
+                    async with http.get(url, params=params) as response:
+                        RESPONSE_BYTES.inc(len(await response.read()), **labels)
+                        if response.status not in RETRY_STATUSES:
+                            response.raise_for_status()
+                            return await response.json()
+                        error = aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                            message=response.reason or "",
+                            headers=response.headers,
+                        )
+                        delay = _retry_after(response)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    error, delay = e, None
+
+                if attempt == self.max_retries:
+                    raise error
+                if delay is None:
+                    delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                REQUEST_RETRIES.inc(**labels)
+                reason = str(error) or type(error).__name__
+                self.logger.warning(
+                    f"Retrying {url} in {delay:.1f}s "
+                    f"({attempt + 1}/{self.max_retries}): {reason}"
+                )
+                await asyncio.sleep(delay)
+
+    async def iter_project_observations(self, http, project_slug, per_page=200):
+        """Yield every observation of a project, in the same order as a serial pager.
+
+        At most `max_workers` pages are requested ahead of the consumer; closing
+        or cancelling the generator cancels them.  With an `archive`, the
+        fetch is recorded there and marked complete at the end.
+        """
+        fetch_id = self.archive.begin(project_slug) if self.archive else None
+
+        async def fetch_page(page):
+            params = {
+                "project_id": project_slug,
+                "per_page": per_page,
+                "page": page,
+                "order_by": "observed_on",
+            }
+            data = await self.get_json(http, "observations", params)
+            if fetch_id is not None:
+                self.archive.append(fetch_id, page, data)
+            return data
+
+        first = await fetch_page(1)
+        pages = math.ceil(first.get("total_results", 0) / per_page)
+        remaining = iter(range(2, pages + 1))
+        window = deque(
+            asyncio.ensure_future(fetch_page(page))
+            for page in islice(remaining, self.max_workers)
+        )
+        try:
+            for obs in first.pop("results", []):
+                yield obs
+            while window:
+                data = await window.popleft()
+                for page in islice(remaining, 1):
+                    window.append(asyncio.ensure_future(fetch_page(page)))
+                for obs in data.get("results", []):
+                    yield obs
+            if fetch_id is not None:
+                self.archive.finish(fetch_id)
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+
+    async def fetch_project_observations(
+        self, project_slug, per_page=200, transform=None, deadline=None
+    ):
+        """Return every observation of a project as a list.
+
+        `transform` is applied to each observation as it arrives (e.g.
+        `slim_observation`, so raw records are never all held at once).  A
+        fetch still running after `deadline` seconds is cancelled and raises
+        `asyncio.TimeoutError`.
+        """
+
+        async def collect():
+            async with self.session() as http:
+                return [
+                    transform(obs) if transform else obs
+                    async for obs in self.iter_project_observations(
+                        http, project_slug, per_page
+                    )
+                ]
+
+        return await asyncio.wait_for(collect(), deadline)
+
+    def fetch_project_observations_sync(self, project_slug, **kwargs):
+        """Run `fetch_project_observations` on a fresh event loop, from sync code."""
+        return asyncio.run(self.fetch_project_observations(project_slug, **kwargs))
+
+    def iter_project_observations_sync(
+        self, project_slug, per_page=200, transform=None, deadline=None
+    ):
+        """Yield every observation of a project to sync code as the pages arrive.
+
+        The fetch runs on its own event loop in a helper thread and hands
+        over each page once it is complete, so the consumer (e.g. the gallery
+        build) works on one page while the next ones download.  The fetch
+        stays at most `max_workers` unread pages ahead and waits for the
+        consumer beyond that, which counts towards `deadline`.  `transform`
+        and `deadline` are as in `fetch_project_observations`; errors are
+        raised in the consumer, and closing the generator cancels the fetch.
+        """
+        pages = queue.Queue(maxsize=self.max_workers)  # pages handed over, unread
+        end = object()
+        running = {}
+        closed = threading.Event()
+
+        def hand_over(item):
+            """Queue `item` for the consumer; give up if it stopped reading."""
+            while not closed.is_set():
+                try:
+                    pages.put(item, timeout=0.05)
+                    return
+                except queue.Full:
+                    pass
+
+        async def hand_over_async(item):
+            while not closed.is_set():
+                try:
+                    pages.put_nowait(item)
+                    return
+                except queue.Full:
+                    await asyncio.sleep(0.01)  # the consumer is behind: stop fetching
+
+        async def pump():
+            page = []
+            async with self.session() as http:
+                observations = self.iter_project_observations(http, project_slug, per_page)
+                async for obs in observations:
+                    page.append(transform(obs) if transform else obs)
+                    if len(page) == per_page:
+                        await hand_over_async(page)
+                        page = []
+            await hand_over_async(page)
+
+        async def main():
+            running["loop"] = asyncio.get_running_loop()
+            running["task"] = asyncio.current_task()
+            if not closed.is_set():
+                await asyncio.wait_for(pump(), deadline)
+
+        def run():
+            try:
+                asyncio.run(main())
+                hand_over(end)
+            except BaseException as e:  # raised again in the consumer
+                hand_over(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while (page := pages.get()) is not end:
+                if isinstance(page, BaseException):
+                    raise page
+                yield from page
+        finally:
+            closed.set()
+            if thread.is_alive() and "task" in running:
+                try:
+                    running["loop"].call_soon_threadsafe(running["task"].cancel)
+                except RuntimeError:
+                    pass  # the loop already finished
+            thread.join()
@@ -0,0 +1,857 @@
+"""Judging: login, the /evaluate queue, score storage, leaderboard and exports.
+
+Registered on the contest app with `init_app(app, load_observations)`.
+The judged edition is `JUDGING_YEAR`; its queue is built from the same
+observation source as the galleries, off-request, and kept in memory.
+"""
+import csv
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from io import RawIOBase, StringIO
+
+import click
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from contest import CONTESTS, first_photo, validate_observation
+from eval_queue import EvaluationQueue
+from metrics import cache_result, instrument_engine
+from obs_cache import file_lock
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional: TSV and CSV exports only
+    pyarrow = None
+
+db = SQLAlchemy()
+bp = Blueprint("judging", __name__, cli_group=None)
+
+
+class Evaluation(db.Model):
+    __table_args__ = (
+        # One score per judge and observation; also serves the per-judge lookups.
+        db.Index(
+            "ux_evaluation_judge_observation",
+            "inat_username",
+            "observation_id",
+            unique=True,
+        ),
+        db.Index("ix_evaluation_observation_id", "observation_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    inat_username = db.Column(db.String(80), nullable=False)
+    observation_id = db.Column(db.Integer, nullable=False)
+    wikipedia_score = db.Column(db.Integer, nullable=False)
+    science_score = db.Column(db.Integer, nullable=False)
+    photographic_score = db.Column(db.Integer, nullable=False)
+    total_score = db.Column(db.Integer, nullable=False)
+
+    def __init__(
+        self,
+        inat_username,
+        observation_id,
+        wikipedia_score,
+        science_score,
+        photographic_score,
+    ):
+        self.inat_username = inat_username
+        self.observation_id = observation_id
+        self.wikipedia_score = wikipedia_score
+        self.science_score = science_score
+        self.photographic_score = photographic_score
+        self.total_score = wikipedia_score + science_score + photographic_score
+
+
+class ObservationScore(db.Model):
+    """Running totals of one observation's evaluations, kept by `upsert_evaluation`."""
+
+    __table_args__ = (db.Index("ix_observation_score_mean_total", "mean_total"),)
+
+    observation_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    evaluations = db.Column(db.Integer, nullable=False)
+    wikipedia_sum = db.Column(db.Integer, nullable=False)
+    science_sum = db.Column(db.Integer, nullable=False)
+    photographic_sum = db.Column(db.Integer, nullable=False)
+    total_sum = db.Column(db.Integer, nullable=False)
+    mean_total = db.Column(db.Float, nullable=False)
+
+    def __init__(self, observation_id):
+        self.observation_id = observation_id
+        self.evaluations = 0
+        self.wikipedia_sum = self.science_sum = self.photographic_sum = 0
+        self.total_sum = 0
+        self.mean_total = 0.0
+
+    def add(self, new_rows, deltas):
+        """Fold one score change into the totals; `new_rows` is 1 for a first score."""
+        self.evaluations += new_rows
+        self.wikipedia_sum += deltas["wikipedia_score"]
+        self.science_sum += deltas["science_score"]
+        self.photographic_sum += deltas["photographic_score"]
+        self.total_sum += deltas["total_score"]
+        self.mean_total = self.total_sum / self.evaluations
+
+
+class JudgeScore(db.Model):
+    """Running totals of one judge's total scores, for per-judge normalization.
+
+    `mean_total` and `inv_sd` (1 / standard deviation, 0 while it is
+    undefined) turn any of the judge's totals into a z-score in SQL.
+    """
+
+    inat_username = db.Column(db.String(80), primary_key=True)
+    evaluations = db.Column(db.Integer, nullable=False)
+    total_sum = db.Column(db.Integer, nullable=False)
+    total_sumsq = db.Column(db.Integer, nullable=False)
+    mean_total = db.Column(db.Float, nullable=False)
+    inv_sd = db.Column(db.Float, nullable=False)
+
+    def __init__(self, inat_username, evaluations=0, total_sum=0, total_sumsq=0):
+        self.inat_username = inat_username
+        self.evaluations = evaluations
+        self.total_sum = total_sum
+        self.total_sumsq = total_sumsq
+        self._update_spread()
+
+    def add(self, new_rows, old_total, new_total):
+        self.evaluations += new_rows
+        self.total_sum += new_total - old_total
+        self.total_sumsq += new_total**2 - old_total**2
+        self._update_spread()
+
+    def _update_spread(self):
+        if not self.evaluations:
+            self.mean_total, self.inv_sd = 0.0, 0.0
+            return
+        self.mean_total = self.total_sum / self.evaluations
+        variance = self.total_sumsq / self.evaluations - self.mean_total**2
+        self.inv_sd = 1 / math.sqrt(variance) if variance > 1e-9 else 0.0
+
+
+class EvaluationVersion(db.Model):
+    """A single counter, bumped in the same transaction as every score change.
+
+    Caches built from the evaluations remember the version they were built
+    at and reload once it moves, whichever worker process took the write.
+    """
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False)
+
+
+def bump_evaluation_version():
+    """Move the evaluation version on; call inside the write's transaction."""
+    statement = sqlite_insert(EvaluationVersion).values(id=1, version=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=["id"], set_={"version": EvaluationVersion.version + 1}
+    )
+    db.session.execute(statement)
+
+
+def evaluation_version():
+    """The current evaluation version (0 before the first score)."""
+    return db.session.execute(db.select(EvaluationVersion.version)).scalar() or 0
+
+
+SCORE_FIELDS = ("wikipedia_score", "science_score", "photographic_score", "total_score")
+
+
+def upsert_evaluation(
+    inat_username, observation_id, wikipedia_score, science_score, photographic_score
+):
+    """Insert or update a judge's score and fold the change into the running totals.
+
+    All in one write transaction: the no-op UPDATE takes SQLite's write lock
+    before the previous score is read, so concurrent submissions of the same
+    score cannot both count it as new.
+    """
+    scores = {
+        "wikipedia_score": wikipedia_score,
+        "science_score": science_score,
+        "photographic_score": photographic_score,
+        "total_score": wikipedia_score + science_score + photographic_score,
+    }
+    key = {"inat_username": inat_username, "observation_id": observation_id}
+    db.session.execute(
+        db.update(Evaluation).filter_by(**key).values(id=Evaluation.id)
+    )
+    previous = db.session.execute(
+        db.select(*(getattr(Evaluation, field) for field in SCORE_FIELDS)).filter_by(**key)
+    ).first()
+    old = dict(zip(SCORE_FIELDS, previous or (0, 0, 0, 0)))
+    new_rows = 0 if previous else 1
+
+    statement = sqlite_insert(Evaluation).values(**key, **scores)
+    statement = statement.on_conflict_do_update(
+        index_elements=["inat_username", "observation_id"], set_=scores
+    )
+    db.session.execute(statement)
+
+    observation_score = db.session.get(ObservationScore, observation_id)
+    if observation_score is None:
+        observation_score = ObservationScore(observation_id)
+        db.session.add(observation_score)
+    observation_score.add(
+        new_rows, {field: scores[field] - old[field] for field in SCORE_FIELDS}
+    )
+    judge_score = db.session.get(JudgeScore, inat_username)
+    if judge_score is None:
+        judge_score = JudgeScore(inat_username)
+        db.session.add(judge_score)
+    judge_score.add(new_rows, old["total_score"], scores["total_score"])
+    bump_evaluation_version()
+    db.session.commit()
+
+
+def rebuild_scores():
+    """Recompute the running totals from the evaluation table."""
+    db.session.query(ObservationScore).delete()
+    db.session.query(JudgeScore).delete()
+    observation_rows = db.session.query(
+        Evaluation.observation_id,
+        db.func.count(),
+        *(db.func.sum(getattr(Evaluation, field)) for field in SCORE_FIELDS),
+    ).group_by(Evaluation.observation_id)
+    observations = 0
+    for observation_id, count, *sums in observation_rows:
+        observations += 1
+        observation_score = ObservationScore(observation_id)
+        observation_score.add(count, dict(zip(SCORE_FIELDS, sums)))
+        db.session.add(observation_score)
+    judge_rows = db.session.query(
+        Evaluation.inat_username,
+        db.func.count(),
+        db.func.sum(Evaluation.total_score),
+        db.func.sum(Evaluation.total_score * Evaluation.total_score),
+    ).group_by(Evaluation.inat_username)
+    for username, count, total_sum, total_sumsq in judge_rows:
+        db.session.add(JudgeScore(username, count, total_sum, total_sumsq))
+    bump_evaluation_version()
+    db.session.commit()
+    return observations
+
+
+def migrate_evaluations_db():
+    """Bring an existing evaluations.db up to the current schema.
+
+    Creates missing tables, drops duplicate (judge, observation) rows,
+    keeping the newest, and adds the indexes; the score totals are
+    recomputed when rows were dropped or their tables are new.  Safe to run
+    repeatedly, and cheap once the database is current.
+    """
+    had_scores = inspect(db.engine).has_table(ObservationScore.__tablename__)
+    db.create_all()
+    with db.engine.begin() as connection:
+        removed = connection.exec_driver_sql(
+            "DELETE FROM evaluation WHERE id NOT IN ("
+            " SELECT MAX(id) FROM evaluation"
+            " GROUP BY inat_username, observation_id)"
+        ).rowcount
+        for index in Evaluation.__table__.indexes:
+            index.create(connection, checkfirst=True)
+    if removed or not had_scores:
+        rebuild_scores()
+    return removed
+
+
+class EvaluationStats:
+    """Progress-grid data for /evaluate, built with two queries instead of 2×N.
+
+    `counts()` is one grouped aggregation over all evaluations and
+    `judged(username)` one lookup of the observations a judge has scored.
+    Both are cached until the evaluation version moves, which every read
+    checks, so a score taken by any worker shows up in all of them.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._counts = None
+        self._judged = {}
+        self._lock = threading.Lock()
+
+    def counts(self):
+        version = evaluation_version()
+        with self._lock:
+            self._expire(version)
+            cache_result("evaluation_counts", "miss" if self._counts is None else "hit")
+            if self._counts is None:
+                rows = (
+                    db.session.query(Evaluation.observation_id, db.func.count())
+                    .group_by(Evaluation.observation_id)
+                    .all()
+                )
+                self._counts = dict(rows)
+            return self._counts
+
+    def judged(self, username):
+        version = evaluation_version()
+        with self._lock:
+            self._expire(version)
+            cache_result("judged", "hit" if username in self._judged else "miss")
+            if username not in self._judged:
+                rows = db.session.query(Evaluation.observation_id).filter_by(
+                    inat_username=username
+                )
+                self._judged[username] = {observation_id for (observation_id,) in rows}
+            return self._judged[username]
+
+    def _expire(self, version):
+        """Drop what was cached at another evaluation version (lock held)."""
+        if version != self._version:
+            self._version = version
+            self._counts = None
+            self._judged = {}
+
+
+evaluation_stats = EvaluationStats()
+
+
+class Leaderboard:
+    """Judged observations ranked from the running score totals.
+
+    "mean" ranks by the mean raw total and reads only `ObservationScore`;
+    "normalized" ranks by the mean of each judge's z-scored totals, so a
+    harsh and a lenient judge weigh the same, in one grouped join against
+    `JudgeScore`.  Rankings are cached until the evaluation version moves,
+    like `EvaluationStats`, so every worker serves a new score at once.
+    """
+
+    ORDERS = ("normalized", "mean")
+
+    def __init__(self):
+        self._version = None
+        self._rankings = {}
+        self._lock = threading.Lock()
+
+    def rows(self, by="normalized"):
+        version = evaluation_version()
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._rankings = {}
+            cache_result("leaderboard", "hit" if by in self._rankings else "miss")
+            if by not in self._rankings:
+                self._rankings[by] = self._rank(by)
+            return self._rankings[by]
+
+    def _rank(self, by):
+        normalized = {}
+        if by == "normalized":
+            z_score = (Evaluation.total_score - JudgeScore.mean_total) * JudgeScore.inv_sd
+            normalized = dict(
+                db.session.query(Evaluation.observation_id, db.func.avg(z_score))
+                .join(JudgeScore, JudgeScore.inat_username == Evaluation.inat_username)
+                .group_by(Evaluation.observation_id)
+            )
+        scores = ObservationScore.query.filter(ObservationScore.evaluations > 0)
+        rows = [
+            {
+                "observation_id": score.observation_id,
+                "evaluations": score.evaluations,
+                "wikipedia_mean": score.wikipedia_sum / score.evaluations,
+                "science_mean": score.science_sum / score.evaluations,
+                "photographic_mean": score.photographic_sum / score.evaluations,
+                "total_mean": score.mean_total,
+                "normalized": normalized.get(score.observation_id),
+            }
+            for score in scores.order_by(
+                ObservationScore.mean_total.desc(), ObservationScore.observation_id
+            )
+        ]
+        if by == "normalized":
+            rows.sort(key=lambda row: -(row["normalized"] or 0.0))  # stable: ties by mean
+        for rank, row in enumerate(rows, 1):
+            row["rank"] = rank
+        return rows
+
+
+leaderboard = Leaderboard()
+
+
+# ------------------------------------------------------------------
+# Judging queue
+# ------------------------------------------------------------------
+def init_app(app, load_observations, taxa=None):
+    """Register judging on `app`.
+
+    `load_observations(project_slug)` must return the project's observations
+    ([] on failure); the judging queue is built from it.  `taxa`, a
+    `TaxonStore`, supplies the evaluation page's taxon details; building the
+    queue looks up every entry's taxon in it ahead of time.
+    """
+    contest = CONTESTS[app.config["JUDGING_YEAR"]]
+    path = os.path.join(app.config["QUEUE_DIR"], f"{contest.project_slug}.queue.json")
+
+    def build():
+        observations = load_observations(contest.project_slug)
+        if not observations:
+            raise RuntimeError(f"No observations available for {contest.project_slug}")
+        entries = build_judging_queue(observations, contest)
+        if taxa is not None:
+            taxa.lookup(entry["taxon_id"] for entry in entries)
+        return entries
+
+    db.init_app(app)
+    with app.app_context():
+        instrument_engine(db.engine)
+        # Every worker imports the app; one at a time brings the schema up to date.
+        lock = os.path.join(app.config["QUEUE_DIR"], "evaluations.migrate.lock")
+        with file_lock(lock):
+            migrate_evaluations_db()
+    app.extensions["judging_queue"] = EvaluationQueue(path, build, logger=app.logger)
+    app.extensions["judging_taxa"] = taxa
+    app.register_blueprint(bp)
+
+
+def judging_queue():
+    return current_app.extensions["judging_queue"]
+
+
+def build_judging_queue(observations, contest):
+    """Return the validated entries judges will score."""
+    return [
+        {
+            "observation_id": obs.get("id", ""),
+            "photo": first_photo(obs),
+            "author": obs.get("user", {}).get("login", "Unknown"),
+            "date": obs.get("observed_on", "Unknown"),
+            "license": first_photo(obs).get("license_code", ""),
+            "species": obs.get("taxon", {}).get("name", "Unknown"),
+            "taxon_id": obs.get("taxon", {}).get("id", None),
+        }
+        for obs in observations
+        if first_photo(obs) and validate_observation(obs, contest)
+    ]
+
+
+# ------------------------------------------------------------------
+# Evaluation export
+# ------------------------------------------------------------------
+EXPORT_COLUMNS = [
+    "id",
+    "inat_username",
+    "observation_id",
+    "observation_link",
+    "wikipedia_score",
+    "science_score",
+    "photographic_score",
+    "total_score",
+]
+EXPORT_BATCH = 5000  # rows per database fetch, written chunk and Parquet row group
+
+
+def iter_evaluation_rows(batch_size=EXPORT_BATCH):
+    """Yield export rows in lists of `batch_size`, never holding the whole table.
+
+    Each batch is its own short keyset query (`id > last ORDER BY id LIMIT
+    n`), finished before its rows are yielded: no cursor or read
+    transaction, and so no SQLite shared lock, stays open while a slow
+    client downloads, and judges can keep saving scores meanwhile.
+    """
+    statement = (
+        db.select(
+            Evaluation.id,
+            Evaluation.inat_username,
+            Evaluation.observation_id,
+            Evaluation.wikipedia_score,
+            Evaluation.science_score,
+            Evaluation.photographic_score,
+            Evaluation.total_score,
+        )
+        .order_by(Evaluation.id)
+        .limit(batch_size)
+    )
+    last_id = 0
+    while True:
+        batch = db.session.execute(statement.where(Evaluation.id > last_id)).all()
+        db.session.rollback()  # end the read transaction before yielding
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        yield [
+            (
+                id,
+                username,
+                observation_id,
+                f"https://www.inaturalist.org/observations/{observation_id}",
+                *scores,
+            )
+            for id, username, observation_id, *scores in batch
+        ]
+        if len(batch) < batch_size:
+            return
+
+
+def delimited_export(delimiter):
+    """Stream the evaluations as delimited text, one chunk per batch of rows."""
+    output = StringIO()
+    writer = csv.writer(output, delimiter=delimiter)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_evaluation_rows():
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    yield output.getvalue()  # the header alone when there are no rows
+
+
+class ChunkSink(RawIOBase):
+    """Write-only file for pyarrow writers; `drain()` returns what is new."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def columnar_export(kind):
+    """Stream the evaluations as Parquet (a row group per batch) or an Arrow IPC stream."""
+    schema = pyarrow.schema(
+        [
+            ("id", pyarrow.int64()),
+            ("inat_username", pyarrow.string()),
+            ("observation_id", pyarrow.int64()),
+            ("observation_link", pyarrow.string()),
+            ("wikipedia_score", pyarrow.int32()),
+            ("science_score", pyarrow.int32()),
+            ("photographic_score", pyarrow.int32()),
+            ("total_score", pyarrow.int32()),
+        ]
+    )
+    sink = ChunkSink()
+    if kind == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    for rows in iter_evaluation_rows():
+        writer.write_batch(
+            pyarrow.record_batch([list(column) for column in zip(*rows)], schema=schema)
+        )
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+# format: (mimetype, file extension, chunk generator)
+EXPORT_FORMATS = {
+    "tsv": ("text/tab-separated-values", "tsv", lambda: delimited_export("\t")),
+    "csv": ("text/csv", "csv", lambda: delimited_export(",")),
+    "parquet": (
+        "application/vnd.apache.parquet",
+        "parquet",
+        lambda: columnar_export("parquet"),
+    ),
+    "arrow": (
+        "application/vnd.apache.arrow.stream",
+        "arrows",
+        lambda: columnar_export("arrow"),
+    ),
+}
+COLUMNAR_FORMATS = {"parquet", "arrow"}
+
+
+# ------------------------------------------------------------------
+# Routes
+# ------------------------------------------------------------------
+@bp.route("/download_evaluations", methods=["GET"])
+def download_evaluations():
+    if "username" not in session:
+        return redirect(url_for("judging.login"))
+
+    export_format = request.args.get("format", "tsv")
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description=f"Unknown export format: {export_format}")
+    if export_format in COLUMNAR_FORMATS and pyarrow is None:
+        abort(400, description=f"The {export_format} export needs pyarrow installed")
+
+    mimetype, extension, export = EXPORT_FORMATS[export_format]
+    return Response(
+        stream_with_context(export()),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment;filename=evaluations.{extension}"
+        },
+    )
+
+
+def ranking_order():
+    by = request.args.get("by", "normalized")
+    return by if by in Leaderboard.ORDERS else "normalized"
+
+
+@bp.route("/leaderboard")
+def show_leaderboard():
+    if "username" not in session:
+        return redirect(url_for("judging.login"))
+
+    by = ranking_order()
+    evaluation_queue = judging_queue()
+    evaluation_queue.refresh()
+    entries = {entry["observation_id"]: entry for entry in evaluation_queue}
+    return render_template(
+        "leaderboard.html", rows=leaderboard.rows(by), entries=entries, by=by
+    )
+
+
+@bp.route("/download_leaderboard")
+def download_leaderboard():
+    if "username" not in session:
+        return redirect(url_for("judging.login"))
+
+    columns = [
+        "rank",
+        "observation_id",
+        "evaluations",
+        "wikipedia_mean",
+        "science_mean",
+        "photographic_mean",
+        "total_mean",
+        "normalized",
+    ]
+    output = StringIO()
+    writer = csv.writer(output, delimiter="\t")
+    writer.writerow([*columns[:2], "observation_link", *columns[2:]])
+    for row in leaderboard.rows(ranking_order()):
+        values = [row[column] for column in columns]
+        writer.writerow(
+            [
+                *values[:2],
+                f"https://www.inaturalist.org/observations/{row['observation_id']}",
+                *(f"{v:.3f}" if isinstance(v, float) else v for v in values[2:]),
+            ]
+        )
+
+    output.seek(0)
+    return Response(
+        output,
+        mimetype="text/tab-separated-values",
+        headers={"Content-Disposition": "attachment;filename=leaderboard.tsv"},
+    )
+
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        username = request.form["username"]
+        password = request.form["password"]
+
+        # Hash the input password
+        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+
+        # The stored hash of the correct password
+        correct_hashed_password = (
+            "4727fbdab27502adbf3a2ade065b30e2095cacb12d58711b596a3755756f8323"
+        )
+
+        if hashed_password == correct_hashed_password:
+            session["username"] = username
+            return redirect(url_for("judging.evaluate"))
+        else:
+            return "Invalid password"
+    return render_template("login.html")
+
+
+@bp.route("/logout")
+def logout():
+    session.pop("username", None)
+    return redirect(url_for("judging.login"))
+
+
+@bp.route("/evaluate", methods=["GET", "POST"])
+def evaluate():
+    if "username" not in session:
+        return redirect(url_for("judging.login"))
+
+    if request.method == "POST":
+        observation_id = request.form["observation_id"]
+        wikipedia_score = int(request.form["wikipedia_score"])
+        science_score = int(request.form["science_score"])
+        photographic_score = int(request.form["photographic_score"])
+
+        upsert_evaluation(
+            session["username"],
+            int(observation_id),
+            wikipedia_score,
+            science_score,
+            photographic_score,
+        )
+
+        index = int(request.args.get("index", 0))
+        next_index = index + 1
+        return redirect(url_for("judging.evaluate", index=next_index))
+
+    evaluation_queue = judging_queue()
+    evaluation_queue.refresh()
+    if not evaluation_queue.exists:
+        # Never block a judge on the fetch; the page shows "building" meanwhile.
+        evaluation_queue.rebuild_in_background()
+    total_observations = len(evaluation_queue)
+
+    index = int(request.args.get("index", 0))
+    prev_index = index - 1 if index > 0 else -1
+    next_index = index + 1 if index < total_observations - 1 else total_observations
+
+    current_observation = None
+    previous_evaluation = None
+    evaluations_info = []
+
+    counts = evaluation_stats.counts()
+    judged = evaluation_stats.judged(session["username"])
+    for i, obs in enumerate(evaluation_queue):
+        evaluations_info.append(
+            {
+                "index": i,
+                "evaluations_count": counts.get(obs["observation_id"], 0),
+                "user_evaluated": obs["observation_id"] in judged,
+            }
+        )
+
+    taxon = None
+    if 0 <= index < total_observations:
+        current_observation = evaluation_queue[index]
+        taxa = current_app.extensions["judging_taxa"]
+        if taxa is not None:
+            taxon = taxa.get(current_observation["taxon_id"])
+        previous_evaluation = Evaluation.query.filter_by(
+            inat_username=session["username"],
+            observation_id=current_observation["observation_id"],
+        ).first()
+
+    return render_template(
+        "evaluate.html",
+        current_observation=current_observation,
+        taxon=taxon,
+        prev_index=prev_index,
+        next_index=next_index,
+        total_observations=total_observations,
+        previous_evaluation=previous_evaluation,
+        datetime=datetime,
+        evaluations_info=evaluations_info,  # Pass evaluations info to the template
+        building=evaluation_queue.building
+        or not (evaluation_queue.exists or evaluation_queue.last_error),
+        build_error=None if evaluation_queue.exists else evaluation_queue.last_error,
+        retry_in=evaluation_queue.retry_in(),
+    )
+
+
+# ------------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------------
+@bp.cli.command("migrate-db")
+def migrate_db_command():
+    """Create missing tables and indexes, dropping duplicate evaluations."""
+    removed = migrate_evaluations_db()
+    click.echo(f"evaluations.db is up to date ({removed} duplicate rows removed)")
+
+
+@bp.cli.command("rebuild-scores")
+def rebuild_scores_command():
+    """Recompute the leaderboard's score totals from every evaluation."""
+    observations = rebuild_scores()
+    click.echo(f"Score totals rebuilt for {observations} observations")
+
+
+@bp.cli.command("build-queue")
+def build_queue_command():
+    """Rebuild the judging queue file from the judged project's observations."""
+    evaluation_queue = judging_queue()
+    try:
+        count = evaluation_queue.rebuild()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{count} entries in {evaluation_queue.path}")
+
+
+@bp.cli.command("queue-info")
+def queue_info_command():
+    """Report the size of the judging queue and the memory it takes per worker."""
+    evaluation_queue = judging_queue()
+    evaluation_queue.refresh()
+    click.echo(
+        f"{len(evaluation_queue)} entries, "
+        f"~{evaluation_queue.memory_bytes() / 1024:.0f} KiB per worker"
+    )
+
+
+@bp.cli.command("bench-evaluations")
+@click.option("--sizes", default="1000,10000,100000", help="Comma-separated row counts.")
+@click.option("--lookups", default=2000, help="Lookups timed per size.")
+def bench_evaluations_command(sizes, lookups):
+    """Time judge and observation lookups on a scratch database as it grows."""
+    with tempfile.TemporaryDirectory() as scratch:
+        engine = create_engine(f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+        Evaluation.__table__.create(engine)
+        judges = [f"judge{j}" for j in range(10)]
+        rows = 0
+        for size in sorted(int(n) for n in sizes.split(",")):
+            with engine.begin() as connection:
+                connection.execute(
+                    Evaluation.__table__.insert(),
+                    [
+                        {
+                            "inat_username": judges[i % len(judges)],
+                            "observation_id": i // len(judges),
+                            "wikipedia_score": 1,
+                            "science_score": 1,
+                            "photographic_score": 1,
+                            "total_score": 3,
+                        }
+                        for i in range(rows, size)
+                    ],
+                )
+            rows = size
+            observations = size // len(judges)
+
+            with engine.connect() as connection:
+                start = time.perf_counter()
+                for i in range(lookups):
+                    connection.exec_driver_sql(
+                        "SELECT id FROM evaluation"
+                        " WHERE inat_username = ? AND observation_id = ?",
+                        (judges[i % len(judges)], (i * 7919) % observations),
+                    ).first()
+                    connection.exec_driver_sql(
+                        "SELECT COUNT(*) FROM evaluation WHERE observation_id = ?",
+                        ((i * 104729) % observations,),
+                    ).scalar()
+                elapsed = time.perf_counter() - start
+            click.echo(
+                f"{size:>8} rows: {elapsed / lookups * 1e6:8.1f} µs per judge+count lookup"
+            )
+        engine.dispose()
@@ -0,0 +1,250 @@
+"""In-process timing and cache metrics, exposed in Prometheus text format.
+
+Modules declare their metrics at import time with `counter()` and
+`histogram()`; the registry keeps one series per label combination.
+`init_app(app)` serves them on `/metrics`, times every template render and
+adds the opt-in per-request profiler.  Each worker process keeps its own
+numbers, so a scrape reflects the worker that answered it.
+"""
+import bisect
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import Response, g, request
+from jinja2 import Template
+from sqlalchemy import event
+
+try:
+    import pyinstrument
+except ImportError:  # optional: cProfile reports only
+    pyinstrument = None
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 60)
+_SQL_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_label_text(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [per-bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(tuple(labels[name] for name in self.labelnames))
+            return series[-1] if series else 0
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        labelnames = (*self.labelnames, "le")
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _label_text(labelnames, (*key, repr(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            # Observations above the last bound sit in no slot: +Inf is the count.
+            labels = _label_text(labelnames, (*key, "+Inf"))
+            yield f"{self.name}_bucket{labels} {values[-1]}"
+            labels = _label_text(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {values[-2]}"
+            yield f"{self.name}_count{labels} {values[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, kind, name, *args, **kwargs):
+        """Return the metric called `name`, creating it on first declaration."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, *args, **kwargs)
+            elif not isinstance(metric, kind):
+                raise ValueError(f"{name} is already registered as a {type(metric)}")
+            return metric
+
+    def expose(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = [line for _, metric in metrics for line in metric.expose()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram, name, documentation, labelnames, buckets)
+
+
+CACHE_REQUESTS = counter(
+    "cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")
+)
+TEMPLATE_SECONDS = histogram(
+    "template_render_seconds", "Jinja template render time.", ("template",)
+)
+DB_QUERY_SECONDS = histogram(
+    "db_query_seconds", "SQL statement time.", ("operation", "table")
+)
+
+
+def cache_result(cache, result, amount=1):
+    """Count `amount` lookups in `cache` that ended in `result` (hit, miss, ...)."""
+    CACHE_REQUESTS.inc(amount, cache=cache, result=result)
+
+
+# ------------------------------------------------------------------
+# Instrumentation hooks
+# ------------------------------------------------------------------
+class TimedTemplate(Template):
+    """A Jinja template whose renders are observed in `template_render_seconds`."""
+
+    def render(self, *args, **kwargs):
+        with TEMPLATE_SECONDS.time(template=self.name or "<string>"):
+            return super().render(*args, **kwargs)
+
+
+def instrument_engine(engine):
+    """Time every statement run on a SQLAlchemy `engine` in `db_query_seconds`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "?"
+        table = _SQL_TABLE.search(statement)
+        DB_QUERY_SECONDS.observe(
+            elapsed, operation=operation, table=table[1] if table else ""
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def failed(context):
+        starts = context.connection.info.get("query_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+# ------------------------------------------------------------------
+# Flask integration
+# ------------------------------------------------------------------
+def init_app(app):
+    """Serve `/metrics`, time template renders and enable request profiling.
+
+    Set `PROFILE_REQUESTS` to let `?profile=1` on any URL write a profile of
+    that request to `PROFILE_DIR` (HTML with pyinstrument, else a cProfile
+    `.prof` file for pstats or snakeviz).
+    """
+    app.config.setdefault("PROFILE_REQUESTS", False)
+    app.config.setdefault("PROFILE_DIR", "profiles")
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(REGISTRY.expose(), mimetype="text/plain; version=0.0.4")
+
+    @app.before_request
+    def start_profile():
+        if not app.config["PROFILE_REQUESTS"] or "profile" not in request.args:
+            return
+        if pyinstrument is not None:
+            g.profiler = pyinstrument.Profiler()
+            g.profiler.start()
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def write_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        os.makedirs(app.config["PROFILE_DIR"], exist_ok=True)
+        name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.endpoint or 'unknown'}"
+        path = os.path.join(app.config["PROFILE_DIR"], name)
+        if pyinstrument is not None:
+            profiler.stop()
+            path += ".html"
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            path += ".prof"
+            profiler.dump_stats(path)
+        app.logger.info(f"Profile of {request.full_path} written to {path}")
+        response.headers["X-Profile"] = os.path.basename(path)
+        return response
@@ -0,0 +1,261 @@
+"""Shared, disk-backed cache of iNaturalist project observations.
+
+Entries are keyed by project slug.  A fresh entry is served as-is; a stale
+one is still served while a single background thread rebuilds it
+(stale-while-revalidate).  Every good snapshot is written to disk, so a
+restarted process picks up where the previous one left off.
+
+Refreshes are single-flight: within a process, callers that need data
+while a refresh runs wait for its result instead of starting their own;
+across processes (web workers, the cron sync) an exclusive lock file per
+project lets one of them fetch while the others reuse what it wrote.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import cache_result
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: refreshes coalesce per process only
+    fcntl = None
+
+
+def write_json_atomic(path, data):
+    """Write JSON to `path` through a temp file so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_bytes_atomic(path, data):
+    """Binary counterpart of `write_json_atomic`."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Hold an exclusive lock on `path` across processes.
+
+    Yields True once the lock is held, or False straight away when
+    `blocking` is off and another process holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class _Flight:
+    """One refresh in progress; followers wait on `done`, then read `entry`."""
+
+    def __init__(self, blocking):
+        self.blocking = blocking  # False: gives up if another process is refreshing
+        self.done = threading.Event()
+        self.entry = None
+
+
+class ObservationCache:
+    def __init__(self, fetch, cache_dir, ttl=600, logger=None, on_refresh=None):
+        """`fetch(project_slug)` must return a list of observations ([] on failure).
+
+        `on_refresh(project_slug, observations)`, if given, is called after
+        every new snapshot is stored, e.g. to rebuild derived data.
+        """
+        self.fetch = fetch
+        self.on_refresh = on_refresh
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        self._flights = {}  # project slug -> _Flight of the refresh in progress
+
+    # --------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------
+    def get(self, project_slug, revalidate=True):
+        """Return the cached observations for a project, fetching on a cold miss.
+
+        With `revalidate=False` a stale entry is served as-is, never refreshed.
+        """
+        entry = self._entry(project_slug)
+        if entry is None:
+            cache_result("observations", "miss")
+            entry = self._coalesced_refresh(project_slug)
+            return entry["observations"] if entry else []
+
+        if revalidate and self.is_stale(entry):
+            # Another process (e.g. the cron sync) may have written a newer snapshot.
+            entry = self._load(project_slug) or entry
+        if revalidate and self.is_stale(entry):
+            cache_result("observations", "stale")
+            self.refresh_in_background(project_slug)
+        else:
+            cache_result("observations", "hit")
+        return entry["observations"]
+
+    def is_stale(self, entry):
+        return time.time() - entry["fetched_at"] > self.ttl
+
+    def refresh_in_background(self, project_slug):
+        """Start a refresh thread unless a refresh of this project is already running.
+
+        If another process holds the project's refresh lock the thread gives
+        up at once: that process writes the snapshot and `get` picks it up.
+        """
+        flight, leader = self._join_flight(project_slug, blocking=False)
+        if leader:
+            thread = threading.Thread(target=self._fly, args=(project_slug, flight))
+            thread.daemon = True
+            thread.start()
+
+    def wait_for_refresh(self, project_slug, timeout=None):
+        """Block until this process's refresh of `project_slug`, if any, is done."""
+        with self._lock:
+            flight = self._flights.get(project_slug)
+        return flight is None or flight.done.wait(timeout)
+
+    def refresh_lock(self, project_slug, blocking=True):
+        """The cross-process lock held while `project_slug` is being refreshed.
+
+        Hold it around any other writer of the project's observations (e.g.
+        the sync command) so it never overlaps a web worker's refresh.
+        """
+        return file_lock(self._path(project_slug) + ".lock", blocking)
+
+    def put(self, project_slug, observations):
+        """Store an externally built snapshot (e.g. from the sync command)."""
+        entry = {"fetched_at": time.time(), "observations": observations}
+        self._store(project_slug, entry)
+
+    # --------------------------------------------------------------
+    # Internals
+    # --------------------------------------------------------------
+    def _path(self, project_slug):
+        return os.path.join(self.cache_dir, f"{project_slug}.json")
+
+    def _entry(self, project_slug):
+        with self._lock:
+            entry = self._entries.get(project_slug)
+        if entry is None:
+            self._load(project_slug)
+            with self._lock:
+                entry = self._entries.get(project_slug)
+        return entry
+
+    def _load(self, project_slug):
+        """Read the on-disk snapshot if it changed since we last read it."""
+        path = self._path(project_slug)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._mtimes.get(project_slug) == mtime:
+                return None
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Ignoring unreadable cache file {path}: {e}")
+            return None
+
+        with self._lock:
+            if mtime <= self._mtimes.get(project_slug, 0):
+                return None  # another thread read this or a newer snapshot meanwhile
+            self._entries[project_slug] = entry
+            self._mtimes[project_slug] = mtime
+        return entry
+
+    def _join_flight(self, project_slug, blocking):
+        """Return `(flight, leader)`; the leader must run it with `_fly`."""
+        with self._lock:
+            flight = self._flights.get(project_slug)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[project_slug] = _Flight(blocking)
+            return flight, True
+
+    def _coalesced_refresh(self, project_slug):
+        """Refresh, or wait for the refresh already in flight, and return its entry."""
+        while True:
+            flight, leader = self._join_flight(project_slug, blocking=True)
+            if leader:
+                self._fly(project_slug, flight)
+                return flight.entry
+            flight.done.wait()
+            entry = flight.entry or self._entry(project_slug)
+            if entry is not None or flight.blocking:
+                return entry
+            # A background refresh that left the fetch to another process: wait for it.
+
+    def _fly(self, project_slug, flight):
+        try:
+            with self.refresh_lock(project_slug, flight.blocking) as locked:
+                if locked:
+                    flight.entry = self._refresh_unless_fresh(project_slug)
+        finally:
+            with self._lock:
+                del self._flights[project_slug]
+            flight.done.set()
+
+    def _refresh_unless_fresh(self, project_slug):
+        """Refresh, unless another process stored a fresh snapshot while we waited."""
+        self._load(project_slug)
+        entry = self._entry(project_slug)
+        if entry is not None and not self.is_stale(entry):
+            return entry
+        return self._refresh(project_slug)
+
+    def _refresh(self, project_slug):
+        """Fetch and store a new snapshot; keep the old one if the fetch fails."""
+        observations = self.fetch(project_slug)
+        if not observations:
+            self.logger.error(f"Refresh of {project_slug} returned no data")
+            return self._entry(project_slug)
+
+        entry = {"fetched_at": time.time(), "observations": observations}
+        self._store(project_slug, entry)
+        return entry
+
+    def _store(self, project_slug, entry):
+        path = self._path(project_slug)
+        write_json_atomic(path, entry)
+        with self._lock:
+            self._entries[project_slug] = entry
+            self._mtimes[project_slug] = os.stat(path).st_mtime
+        if self.on_refresh is not None:
+            self.on_refresh(project_slug, entry["observations"])
@@ -0,0 +1,173 @@
+"""Append-only archive of raw iNaturalist API pages.
+
+Every page of a full project fetch is stored zlib-compressed at the end of
+the project's data file (`<slug>.pages`); a SQLite index maps (fetch,
+page) to its byte range and records when each fetch ran.  Nothing is ever
+rewritten: a crash mid-append leaves unindexed bytes that are simply never
+read.  Reads go through a memory map of the data file and decompress one
+page at a time, so replaying an archived fetch (e.g. re-validating a past
+edition under different rules) needs neither the network nor a full JSON
+reload.
+"""
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+
+from obs_cache import file_lock
+
+
+class PageArchive:
+    def __init__(self, directory, level=6, logger=None):
+        self.directory = directory
+        self.level = level
+        self.logger = logger or logging.getLogger(__name__)
+        self._maps = {}  # project slug -> read-only mmap of its data file
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fetch ("
+                " id INTEGER PRIMARY KEY, project TEXT NOT NULL,"
+                " started_at REAL NOT NULL, finished_at REAL,"
+                " pages INTEGER NOT NULL DEFAULT 0,"
+                " observations INTEGER NOT NULL DEFAULT 0,"
+                " bytes INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_fetch_project_started"
+                " ON fetch (project, started_at)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS page ("
+                " fetch_id INTEGER NOT NULL REFERENCES fetch (id),"
+                " page INTEGER NOT NULL, fetched_at REAL NOT NULL,"
+                " byte_offset INTEGER NOT NULL, byte_length INTEGER NOT NULL,"
+                " PRIMARY KEY (fetch_id, page))"
+            )
+
+    # --------------------------------------------------------------
+    # Recording
+    # --------------------------------------------------------------
+    def begin(self, project_slug):
+        """Start recording a fetch of `project_slug`; return its id."""
+        with closing(self._connect()) as connection, connection:
+            return connection.execute(
+                "INSERT INTO fetch (project, started_at) VALUES (?, ?)",
+                (project_slug, time.time()),
+            ).lastrowid
+
+    def append(self, fetch_id, page, data):
+        """Archive one API response body (`data`, as parsed) as `page` of a fetch.
+
+        Safe to call from several threads, in any page order.
+        """
+        blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode(), self.level)
+        project_slug = self._project(fetch_id)
+        path = self._data_path(project_slug)
+        with self._lock, file_lock(path + ".lock"):
+            with open(path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO page VALUES (?, ?, ?, ?, ?)",
+                    (fetch_id, page, time.time(), offset, len(blob)),
+                )
+                connection.execute(
+                    "UPDATE fetch SET pages = pages + 1, observations = observations + ?,"
+                    " bytes = bytes + ? WHERE id = ?",
+                    (len(data.get("results", ())), len(blob), fetch_id),
+                )
+
+    def finish(self, fetch_id):
+        """Mark a fetch complete; only complete fetches are replayed."""
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE fetch SET finished_at = ? WHERE id = ?", (time.time(), fetch_id)
+            )
+
+    # --------------------------------------------------------------
+    # Reading
+    # --------------------------------------------------------------
+    def fetches(self, project_slug):
+        """Every recorded fetch of a project, oldest first."""
+        with closing(self._connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                "SELECT * FROM fetch WHERE project = ? ORDER BY started_at, id",
+                (project_slug,),
+            )
+            return [dict(row) for row in rows]
+
+    def latest(self, project_slug, as_of=None):
+        """The last complete fetch started at or before `as_of` (a timestamp), or None."""
+        with closing(self._connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute(
+                "SELECT * FROM fetch WHERE project = ? AND finished_at IS NOT NULL"
+                " AND started_at <= ? ORDER BY started_at DESC, id DESC LIMIT 1",
+                (project_slug, time.time() if as_of is None else as_of),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def iter_pages(self, fetch_id):
+        """Yield the archived response bodies of a fetch in page order."""
+        project_slug = self._project(fetch_id)
+        with closing(self._connect()) as connection:
+            ranges = connection.execute(
+                "SELECT byte_offset, byte_length FROM page"
+                " WHERE fetch_id = ? ORDER BY page",
+                (fetch_id,),
+            ).fetchall()
+        for offset, length in ranges:
+            view = self._map(project_slug, offset + length)
+            yield json.loads(zlib.decompress(view[offset : offset + length]))
+
+    def iter_observations(self, project_slug, as_of=None):
+        """Replay a project's last complete fetch (see `latest`), one observation at a time.
+
+        Raises `LookupError` when nothing has been archived for it.
+        """
+        fetch = self.latest(project_slug, as_of)
+        if fetch is None:
+            raise LookupError(f"No complete archived fetch of {project_slug}")
+        for data in self.iter_pages(fetch["id"]):
+            yield from data.get("results", [])
+
+    # --------------------------------------------------------------
+    # Internals
+    # --------------------------------------------------------------
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30)
+
+    def _data_path(self, project_slug):
+        return os.path.join(self.directory, f"{project_slug}.pages")
+
+    def _project(self, fetch_id):
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT project FROM fetch WHERE id = ?", (fetch_id,)
+            ).fetchone()
+        if row is None:
+            raise LookupError(f"No archived fetch {fetch_id}")
+        return row[0]
+
+    def _map(self, project_slug, end):
+        """A read-only map of the project's data file covering at least `end` bytes."""
+        with self._lock:
+            view = self._maps.get(project_slug)
+            if view is None or len(view) < end:
+                # The file only grows; map it again, leaving older maps to the
+                # readers still slicing them.
+                with open(self._data_path(project_slug), "rb") as f:
+                    view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[project_slug] = view
+            return view
@@ -0,0 +1,96 @@
+"""Rendered-page cache with conditional GET and pre-compressed bodies.
+
+A gallery page only changes when its snapshot or the code rendering it
+does, so the rendered HTML is kept per (page, data version, build) and
+compressed at most once per encoding.  Responses carry an ETag derived from
+both and a Last-Modified from the snapshot; a browser that already has the
+current version gets a 304, and one holding a page from an earlier deploy
+gets the new markup.
+"""
+import glob
+import gzip
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+
+from flask import Response
+
+from metrics import cache_result
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+
+
+class RenderedPage:
+    def __init__(self, html, version, built_at):
+        self.version = version
+        self.last_modified = datetime.fromtimestamp(built_at, tz=timezone.utc)
+        self._bodies = {"identity": html.encode()}
+        self._lock = threading.Lock()
+
+    def body(self, encoding):
+        """Return the page body in `encoding`, compressing it on first use."""
+        with self._lock:
+            if encoding not in self._bodies:
+                self._bodies[encoding] = COMPRESSORS[encoding](self._bodies["identity"])
+            return self._bodies[encoding]
+
+    def response(self, request):
+        """Build a (possibly 304) response for `request`."""
+        encoding = request.accept_encodings.best_match(
+            [*COMPRESSORS, "identity"], default="identity"
+        )
+        response = Response(self.body(encoding), mimetype="text/html")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache"  # always revalidate
+        response.set_etag(self.version, weak=True)  # same data, any encoding
+        response.last_modified = self.last_modified
+        return response.make_conditional(request)
+
+
+def source_digest(root, patterns=("templates/*.html", "*.py")):
+    """A short digest of the templates and code (filters included) under `root`."""
+    digest = hashlib.sha256()
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class PageCache:
+    """Keeps the latest rendering of each page, keyed by data version and build.
+
+    `build_id` names the code that renders the pages (e.g. `source_digest`
+    of the app, or a release id); it is part of every page's version.
+    """
+
+    def __init__(self, build_id=""):
+        self.build_id = build_id
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, snapshot, render):
+        """Return the page for `snapshot`, calling `render()` only on a new version."""
+        version = f"{snapshot['version']}-{self.build_id}"
+        with self._lock:
+            page = self._pages.get(key)
+        if page is not None and page.version == version:
+            cache_result("pages", "hit")
+            return page
+
+        cache_result("pages", "miss")
+        page = RenderedPage(render(), version, snapshot["built_at"])
+        with self._lock:
+            self._pages[key] = page
+        return page
@@ -0,0 +1,181 @@
+"""Precomputed gallery snapshots, one versioned file per contest project.
+
+Classification, per-user bucketing, the alphabetical sort and the
+max-three cap run once per data refresh instead of once per page view; the
+gallery route only loads the snapshot and renders it.  Each snapshot
+records the file format it was written with and a content `version` hash,
+so a format change forces a rebuild and callers can tell whether the data
+actually changed.
+
+Next to each snapshot the builder's index (per-observation fingerprints
+and per-user observation order, see `contest.patch_user_photos`) is kept,
+so the next rebuild only redoes what changed.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from contest import PhotoRecord
+from obs_cache import write_json_atomic
+
+SNAPSHOT_FORMAT = 2
+
+
+def plain_user_photos(user_photos):
+    """Turn the nested defaultdicts of a gallery into plain, JSON-ready dicts."""
+    return {
+        user: {
+            "validated": dict(buckets["validated"]),
+            "unvalidated": dict(buckets["unvalidated"]),
+        }
+        for user, buckets in user_photos.items()
+    }
+
+
+def load_user_photos(data):
+    """Inverse of `plain_user_photos` after a JSON round trip: rows back to records."""
+    return {
+        user: {
+            kind: {
+                category: [PhotoRecord.from_row(row) for row in rows]
+                for category, rows in categories.items()
+            }
+            for kind, categories in buckets.items()
+        }
+        for user, buckets in data.items()
+    }
+
+
+class SnapshotStore:
+    def __init__(self, build, snapshot_dir, logger=None):
+        """`build(project_slug, observations, previous)` builds the per-user gallery.
+
+        `previous` is None or the `(user_photos, index)` of the current
+        snapshot; `build` returns `(user_photos, index, reclassified)`.
+        """
+        self.build = build
+        self.snapshot_dir = snapshot_dir
+        self.logger = logger or logging.getLogger(__name__)
+        self._snapshots = {}
+        self._mtimes = {}
+        self._indexes = {}  # project slug -> (snapshot version, builder index)
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------
+    def get(self, project_slug):
+        """Return the current snapshot of a project, or None if none was built yet."""
+        self._load(project_slug)
+        with self._lock:
+            return self._snapshots.get(project_slug)
+
+    def rebuild(self, project_slug, observations):
+        """Build a snapshot from `observations`, write it to disk and return it.
+
+        `observations` may be any iterable, e.g. a live page stream.  If it
+        turns out empty the current snapshot is kept and None is returned.
+        """
+        count = 0
+
+        def counted():
+            nonlocal count
+            for obs in observations:
+                count += 1
+                yield obs
+
+        user_photos, index, reclassified = self.build(
+            project_slug, counted(), self._previous(project_slug)
+        )
+        if not count:
+            self.logger.error(f"No observations to build a snapshot of {project_slug}")
+            return None
+        user_photos = plain_user_photos(user_photos)
+        payload = json.dumps(user_photos, sort_keys=True).encode()
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "project_slug": project_slug,
+            "version": hashlib.sha256(payload).hexdigest()[:16],
+            "built_at": time.time(),
+            "observation_count": count,
+            "user_photos": user_photos,
+        }
+
+        path = self._path(project_slug)
+        write_json_atomic(
+            self._index_path(project_slug),
+            {"format": SNAPSHOT_FORMAT, "version": snapshot["version"], **index},
+        )
+        write_json_atomic(path, snapshot)
+        with self._lock:
+            self._snapshots[project_slug] = snapshot
+            self._mtimes[project_slug] = os.stat(path).st_mtime
+            self._indexes[project_slug] = (snapshot["version"], index)
+        self.logger.info(
+            f"Built snapshot {snapshot['version']} of {project_slug} "
+            f"({count} observations, {reclassified} reclassified, "
+            f"{len(user_photos)} users)"
+        )
+        return snapshot
+
+    def age(self, snapshot):
+        return time.time() - snapshot["built_at"]
+
+    # --------------------------------------------------------------
+    # Internals
+    # --------------------------------------------------------------
+    def _path(self, project_slug):
+        return os.path.join(self.snapshot_dir, f"{project_slug}.snapshot.json")
+
+    def _index_path(self, project_slug):
+        return os.path.join(self.snapshot_dir, f"{project_slug}.snapshot.index.json")
+
+    def _previous(self, project_slug):
+        """The current snapshot's `(user_photos, index)`, or None if they don't match."""
+        snapshot = self.get(project_slug)
+        if snapshot is None:
+            return None
+        with self._lock:
+            version, index = self._indexes.get(project_slug, (None, None))
+        if version != snapshot["version"]:
+            try:
+                with open(self._index_path(project_slug), "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return None  # e.g. written by an older build: start from scratch
+            if data.pop("format", None) != SNAPSHOT_FORMAT:
+                return None
+            if data.pop("version", None) != snapshot["version"]:
+                return None
+            index = data
+            with self._lock:
+                self._indexes[project_slug] = (snapshot["version"], index)
+        return snapshot["user_photos"], index
+
+    def _load(self, project_slug):
+        """Read the on-disk snapshot if it changed since we last read it."""
+        path = self._path(project_slug)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._mtimes.get(project_slug) == mtime:
+                return
+        try:
+            with open(path, "r") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Ignoring unreadable snapshot {path}: {e}")
+            return
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            self.logger.warning(f"Ignoring snapshot {path} in an old format")
+            return
+        snapshot["user_photos"] = load_user_photos(snapshot["user_photos"])
+
+        with self._lock:
+            self._snapshots[project_slug] = snapshot
+            self._mtimes[project_slug] = mtime
@@ -0,0 +1,170 @@
+"""Incremental sync of an iNaturalist project into a local observation store.
+
+The store keeps every observation of a project keyed by id, plus a
+high-water mark: the time the last sync started, less a small overlap.  A
+sync only asks the API for observations updated since that mark and merges
+them in by id, so a refresh costs a handful of small requests instead of a
+full re-download.
+
+Observations that leave the project (deleted, or removed by their author)
+never show up in an `updated_since` query.  A sync therefore compares the
+stored count with the project's `total_results` and re-fetches everything
+when they differ, and does so anyway once every `FULL_SYNC_INTERVAL`.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from inat import INatClient, slim_observation
+from obs_cache import write_json_atomic
+
+PER_PAGE = 200
+SYNC_OVERLAP = timedelta(minutes=5)  # covers clock skew and in-flight API writes
+FULL_SYNC_INTERVAL = 24 * 3600  # seconds between unconditional full syncs
+
+logger = logging.getLogger(__name__)
+
+
+def store_path(store_dir, project_slug):
+    return os.path.join(store_dir, f"{project_slug}.store.json")
+
+
+def load_store(store_dir, project_slug):
+    """Return the stored {"high_water_mark", "full_synced_at", "observations"}.
+
+    An empty store if there is none yet.
+    """
+    path = store_path(store_dir, project_slug)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.error(f"Ignoring unreadable store {path}: {e}")
+    return empty_store()
+
+
+def empty_store():
+    return {"high_water_mark": None, "full_synced_at": None, "observations": {}}
+
+
+def fetch_updated_observations(client, project_slug, updated_since=None, taxa=None):
+    """Return every observation of the project updated after `updated_since`.
+
+    Pages by ascending id (`id_above`) rather than by page number, so records
+    updated while we page cannot shift the window and be skipped.  Each raw
+    page's taxa are harvested into `taxa` (a `TaxonStore`) before slimming.
+    """
+    results = []
+    last_id = 0
+
+    while True:
+        params = {
+            "project_id": project_slug,
+            "per_page": PER_PAGE,
+            "order_by": "id",
+            "order": "asc",
+            "id_above": last_id,
+        }
+        if updated_since:
+            params["updated_since"] = updated_since
+
+        page = client.get_json("observations", params).get("results", [])
+        if taxa is not None:
+            taxa.harvest(page)
+        results.extend(slim_observation(obs) for obs in page)
+        if len(page) < PER_PAGE:
+            break
+        last_id = page[-1]["id"]
+
+    return results
+
+
+def count_project_observations(client, project_slug):
+    """The project's current `total_results`, from a `per_page=0` query."""
+    data = client.get_json("observations", {"project_id": project_slug, "per_page": 0})
+    return data.get("total_results", 0)
+
+
+def merge_observations(store, updated, high_water_mark):
+    """Merge `updated` into the store by id and move the high-water mark.
+
+    `high_water_mark` is when the sync started, less `SYNC_OVERLAP`, rather
+    than the newest `updated_at` seen: a record updated while we page by id
+    may already lie behind the page we are on, and must come back next time.
+    """
+    observations = store["observations"]
+    for obs in updated:
+        observations[str(obs["id"])] = obs
+    store["high_water_mark"] = high_water_mark
+    return store
+
+
+def ordered_observations(store):
+    """Return stored observations newest `observed_on` first, like the API pager."""
+    return sorted(
+        store["observations"].values(),
+        key=lambda obs: (obs.get("observed_on") or "", obs["id"]),
+        reverse=True,
+    )
+
+
+def sync_project(
+    store_dir,
+    project_slug,
+    full=False,
+    client=None,
+    taxa=None,
+    full_sync_interval=FULL_SYNC_INTERVAL,
+):
+    """Bring the local store up to date and return its observations.
+
+    Falls back to a full sync when asked to, when the last one is older than
+    `full_sync_interval` seconds, or when the incremental result does not
+    hold as many observations as the project (something left it).  Returns
+    [] if the API cannot be reached and nothing is stored yet, the same
+    contract as `fetch_project_observations`.
+    """
+    store = load_store(store_dir, project_slug)
+    last_full = store.get("full_synced_at")
+    if last_full is None or time.time() - last_full > full_sync_interval:
+        full = True
+
+    client = client or INatClient()
+    started = time.time()
+    high_water_mark = (datetime.now(timezone.utc) - SYNC_OVERLAP).isoformat(
+        timespec="seconds"
+    )
+    try:
+        if not full:
+            updated = fetch_updated_observations(
+                client, project_slug, store["high_water_mark"], taxa
+            )
+            merge_observations(store, updated, high_water_mark)
+            total = count_project_observations(client, project_slug)
+            if total != len(store["observations"]):
+                logger.info(
+                    f"{project_slug} has {total} observations, {len(store['observations'])} "
+                    f"stored: reconciling with a full sync"
+                )
+                full = True
+        if full:
+            updated = fetch_updated_observations(client, project_slug, None, taxa)
+            store = empty_store()
+            merge_observations(store, updated, high_water_mark)
+            store["full_synced_at"] = started
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to sync {project_slug}: {e}")
+        return ordered_observations(load_store(store_dir, project_slug))
+
+    write_json_atomic(store_path(store_dir, project_slug), store)
+    logger.info(
+        f"Synced {project_slug} ({'full' if full else 'incremental'}): "
+        f"{len(updated)} updated, {len(store['observations'])} stored"
+    )
+    return ordered_observations(store)
@@ -0,0 +1,201 @@
+"""Local taxon metadata, keyed by taxon id and persisted in SQLite.
+
+Observations only carry their taxon's id, name and rank; ancestry, iconic
+group, common name and status are resolved here with a dict lookup.  The
+store is filled from the taxa embedded in fetched observations and, for ids
+it has never seen, by batched `/v1/taxa/<id>,<id>,...` lookups.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import requests
+
+from metrics import cache_result
+
+BATCH_SIZE = 30  # ids per /v1/taxa request, the API's page size for id lists
+COLUMNS = (
+    "id",
+    "name",
+    "rank",
+    "ancestor_ids",
+    "iconic_taxon_name",
+    "preferred_common_name",
+    "observations_count",
+    "conservation_status",
+)
+
+
+def taxon_record(taxon):
+    """Project an API taxon down to the fields we keep."""
+    status = taxon.get("conservation_status") or {}
+    return {
+        "id": taxon["id"],
+        "name": taxon.get("name"),
+        "rank": taxon.get("rank"),
+        "ancestor_ids": list(taxon.get("ancestor_ids") or ()),
+        "iconic_taxon_name": taxon.get("iconic_taxon_name"),
+        "preferred_common_name": taxon.get("preferred_common_name"),
+        "observations_count": taxon.get("observations_count"),
+        "conservation_status": status.get("status_name"),
+    }
+
+
+def _row(record):
+    return (
+        *(record[column] for column in COLUMNS[:3]),
+        ",".join(map(str, record["ancestor_ids"])),
+        *(record[column] for column in COLUMNS[4:]),
+        time.time(),
+    )
+
+
+def _record(row):
+    record = dict(zip(COLUMNS, row))
+    ancestors = record["ancestor_ids"]
+    record["ancestor_ids"] = [int(i) for i in ancestors.split(",")] if ancestors else []
+    return record
+
+
+class TaxonStore:
+    def __init__(self, path, client=None, logger=None):
+        """`client` (an `INatClient`) is used to look up ids the store lacks."""
+        self.path = path
+        self.client = client
+        self.logger = logger or logging.getLogger(__name__)
+        self._taxa = None  # id -> record, loaded on first use
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS taxon ("
+                " id INTEGER PRIMARY KEY, name TEXT, rank TEXT,"
+                " ancestor_ids TEXT NOT NULL, iconic_taxon_name TEXT,"
+                " preferred_common_name TEXT, observations_count INTEGER,"
+                " conservation_status TEXT, updated_at REAL NOT NULL)"
+            )
+
+    # --------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------
+    def get(self, taxon_id, default=None):
+        """Return the stored taxon, or `default`; never goes to the API.
+
+        With `__len__`, this lets the store itself stand in for the `taxa`
+        dict of the classifiers when there is no list of ids to look up
+        first (e.g. a live page stream, whose taxa are staged as it arrives).
+        """
+        with self._lock:
+            self._load()
+            return self._taxa.get(taxon_id, default)
+
+    def stage(self, taxon):
+        """Remember an API taxon (e.g. one embedded in an observation) until `flush()`."""
+        if not taxon or taxon.get("id") is None or "ancestor_ids" not in taxon:
+            return  # a slim taxon: nothing to learn from it
+        record = taxon_record(taxon)
+        with self._lock:
+            self._load()
+            self._taxa[record["id"]] = record
+            self._pending[record["id"]] = record
+
+    def harvest(self, observations):
+        """Stage the taxa embedded in raw observations and write them out."""
+        for obs in observations:
+            self.stage(obs.get("taxon"))
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO taxon ({', '.join(COLUMNS)}, updated_at)"
+                f" VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                [_row(record) for record in pending.values()],
+            )
+
+    def lookup(self, taxon_ids):
+        """Return {id: taxon} for `taxon_ids`, fetching unknown ones in batches.
+
+        Ids another worker stored since we loaded are read from SQLite; the
+        rest are asked of the API.  Ids the API cannot resolve are left out,
+        but a failed request raises: classifying without the taxa's ancestry
+        would file their photos under "others", and frozen contests never
+        rebuild to correct it.
+        """
+        taxon_ids = {taxon_id for taxon_id in taxon_ids if taxon_id is not None}
+        with self._lock:
+            self._load()
+            missing = sorted(taxon_ids - self._taxa.keys())
+        cache_result("taxa", "hit", len(taxon_ids) - len(missing))
+        if missing:
+            self._read(missing)
+            with self._lock:
+                stored = len(missing)
+                missing = [taxon_id for taxon_id in missing if taxon_id not in self._taxa]
+            cache_result("taxa", "stored", stored - len(missing))
+            cache_result("taxa", "miss", len(missing))
+        if missing and self.client is not None:
+            self._fetch(missing)
+        with self._lock:
+            return {
+                taxon_id: self._taxa[taxon_id]
+                for taxon_id in taxon_ids
+                if taxon_id in self._taxa
+            }
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._taxa)
+
+    # --------------------------------------------------------------
+    # Internals
+    # --------------------------------------------------------------
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self):
+        """Read the whole table into memory on first use (lock held)."""
+        if self._taxa is not None:
+            return
+        with closing(self._connect()) as connection:
+            rows = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM taxon")
+            self._taxa = {row[0]: _record(row) for row in rows}
+
+    def _read(self, taxon_ids):
+        with closing(self._connect()) as connection:
+            rows = []
+            for start in range(0, len(taxon_ids), 500):
+                batch = taxon_ids[start : start + 500]
+                rows += connection.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM taxon"
+                    f" WHERE id IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+        with self._lock:
+            for row in rows:
+                self._taxa[row[0]] = _record(row)
+
+    def _fetch(self, taxon_ids):
+        """Fetch `taxon_ids` in batches; the batches before a failed one are kept."""
+        try:
+            for start in range(0, len(taxon_ids), BATCH_SIZE):
+                batch = taxon_ids[start : start + BATCH_SIZE]
+                data = self.client.get_json(
+                    f"taxa/{','.join(map(str, batch))}", {"per_page": BATCH_SIZE}
+                )
+                for taxon in data.get("results", []):
+                    self.stage(taxon)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Failed to look up {len(taxon_ids)} taxa: {e}")
+            raise
+        finally:
+            self.flush()
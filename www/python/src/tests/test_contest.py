@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+from bench import (
+    _cards,
+    _legacy_bucketing,
+    _single_pass_bucketing,
+    synthetic_observations,
+)
+from contest import CONTESTS, CURRENT_YEAR
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_single_pass_bucketing_matches_nested_loop(seed):
+    rng = random.Random(seed)
+    # Few users and small sets, so caps and overflows are exercised often.
+    observations = synthetic_observations(rng.randrange(0, 120), seed=seed)
+    users = rng.randrange(1, 8)
+    for obs in observations:
+        obs["user"] = {"login": f"user{rng.randrange(users)}"}
+    cards = _cards(observations, CONTESTS[CURRENT_YEAR])
+    assert _single_pass_bucketing(cards) == _legacy_bucketing(cards)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from bench import StubAPI, api_pages, synthetic_observations
+from inat_async import AsyncINatClient
+
+COUNT = 1000
+
+
+@pytest.fixture(scope="module")
+def observations():
+    return synthetic_observations(COUNT, raw=True)
+
+
+def client(stub, **options):
+    options = {"rate": 1e9, "burst": 1e9, "backoff": 0.01, **options}
+    return AsyncINatClient(base_url=stub.url, **options)
+
+
+def test_429_is_retried_after_retry_after(observations):
+    with StubAPI(observations, faults={2: [(429, {"Retry-After": "1"})]}) as stub:
+        start = time.perf_counter()
+        fetched = client(stub).fetch_project_observations_sync("x")
+        elapsed = time.perf_counter() - start
+    assert [obs["id"] for obs in fetched] == [obs["id"] for obs in observations]
+    assert elapsed >= 1
+    assert stub.requests == len(api_pages(observations)) + 1
+
+
+def test_5xx_is_retried_with_backoff(observations):
+    with StubAPI(observations, faults={3: [(503, {}), (502, {})]}) as stub:
+        fetched = client(stub).fetch_project_observations_sync("x")
+    assert len(fetched) == COUNT
+    assert stub.requests == len(api_pages(observations)) + 2
+
+
+def test_5xx_fails_the_fetch_once_retries_run_out(observations):
+    with StubAPI(observations, faults={2: [(503, {})] * 3}) as stub:
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            client(stub, max_retries=2).fetch_project_observations_sync("x")
+    assert error.value.status == 503
+
+
+@pytest.mark.parametrize("retries", [0, 1])
+def test_slow_page_hits_the_request_timeout(observations, retries):
+    with StubAPI(observations, faults={2: [2.0]}) as stub:
+        slow = client(stub, timeout=0.5, max_retries=retries)
+        start = time.perf_counter()
+        if retries:
+            assert len(slow.fetch_project_observations_sync("x")) == COUNT
+        else:
+            with pytest.raises(asyncio.TimeoutError):
+                slow.fetch_project_observations_sync("x")
+        assert time.perf_counter() - start < 2
+
+
+def test_deadline_cancels_the_pages_in_flight(observations):
+    with StubAPI(observations, per_page=50, delay=0.3) as stub:
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            client(stub, max_workers=2).fetch_project_observations_sync(
+                "x", per_page=50, deadline=1
+            )
+        assert time.perf_counter() - start < 1.5
+        requests = stub.requests
+        time.sleep(1)
+        assert stub.requests == requests  # nothing is still paging
+
+
+
+def test_page_stream_yields_every_observation_in_order(observations):
+    with StubAPI(observations, per_page=50) as stub:
+        stream = client(stub).iter_project_observations_sync("x", per_page=50)
+        assert [obs["id"] for obs in stream] == [obs["id"] for obs in observations]
+
+
+def test_page_stream_waits_for_a_slow_consumer(observations):
+    with StubAPI(observations, per_page=50) as stub:
+        stream = client(stub, max_workers=2).iter_project_observations_sync(
+            "x", per_page=50
+        )
+        next(stream)
+        time.sleep(0.5)
+        # Page 1 is being read, two are queued, one is waiting to be queued
+        # and two are in flight: the other 14 pages are not fetched yet.
+        assert stub.requests <= 6
+        start = time.perf_counter()
+        stream.close()  # the fetch is cancelled, not left blocked on the queue
+        assert time.perf_counter() - start < 1
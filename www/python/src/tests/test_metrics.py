@@ -0,0 +1,34 @@
+import re
+
+from metrics import Histogram
+
+
+def buckets_of(histogram):
+    exposed = "\n".join(histogram.expose())
+    return {
+        le: float(value)
+        for le, value in re.findall(r'_bucket\{.*le="([^"]+)"\} (\S+)', exposed)
+    }, exposed
+
+
+def test_inf_bucket_equals_count():
+    histogram = Histogram("t_seconds", "Test.", buckets=(1, 2))
+    for value in (0.5, 1.5, 100, 250):
+        histogram.observe(value)
+    buckets, exposed = buckets_of(histogram)
+    assert buckets == {"1.0": 1, "2.0": 2, "+Inf": 4}
+    assert "t_seconds_count 4" in exposed
+    assert "t_seconds_sum 352.0" in exposed
+
+
+def test_buckets_are_cumulative_per_series():
+    histogram = Histogram("t_seconds", "Test.", ("route",), buckets=(0.1, 1))
+    histogram.observe(0.05, route="a")
+    histogram.observe(5, route="a")
+    histogram.observe(0.5, route="b")
+    exposed = "\n".join(histogram.expose())
+    assert 't_seconds_bucket{route="a",le="0.1"} 1' in exposed
+    assert 't_seconds_bucket{route="a",le="1.0"} 1' in exposed
+    assert 't_seconds_bucket{route="a",le="+Inf"} 2' in exposed
+    assert 't_seconds_bucket{route="b",le="+Inf"} 1' in exposed
+    assert histogram.count(route="a") == 2
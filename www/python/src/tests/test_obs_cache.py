@@ -0,0 +1,60 @@
+import multiprocessing
+import threading
+import time
+
+from bench import StubAPI, synthetic_observations
+from inat import INatClient
+from obs_cache import ObservationCache
+
+PROCESSES = 4
+THREADS = 25
+COUNT = 2000
+TTL = 3
+
+
+def burst(url, cache_dir, barrier, results):
+    """One worker process: `THREADS` simultaneous page views on a shared cache."""
+    client = INatClient(base_url=url, rate=1e9, burst=1e9)
+    cache = ObservationCache(
+        lambda slug: list(client.iter_project_observations(slug)), cache_dir, ttl=TTL
+    )
+
+    def view():
+        barrier.wait()
+        results.put(len(cache.get("project")))
+
+    viewers = [threading.Thread(target=view) for _ in range(THREADS)]
+    for viewer in viewers:
+        viewer.start()
+    for viewer in viewers:
+        viewer.join()
+    cache.wait_for_refresh("project")  # let a background refresh finish
+
+
+def run_burst(context, url, cache_dir):
+    barrier = context.Barrier(PROCESSES * THREADS)
+    results = context.Queue()
+    workers = [
+        context.Process(target=burst, args=(url, cache_dir, barrier, results))
+        for _ in range(PROCESSES)
+    ]
+    for worker in workers:
+        worker.start()
+    served = [results.get(timeout=120) for _ in range(PROCESSES * THREADS)]
+    for worker in workers:
+        worker.join()
+    return served
+
+
+def test_bursts_share_one_pagination(tmp_path):
+    """A cold burst waits on one fetch; a stale one is served while one refresh runs."""
+    context = multiprocessing.get_context("fork")
+    with StubAPI(synthetic_observations(COUNT), delay=0.05) as stub:
+        served = run_burst(context, stub.url, str(tmp_path))
+        assert stub.paginations == 1
+        assert served == [COUNT] * len(served)
+
+        time.sleep(TTL + 0.5)
+        served = run_burst(context, stub.url, str(tmp_path))
+        assert stub.paginations == 2
+        assert served == [COUNT] * len(served)
@@ -0,0 +1,40 @@
+import pytest
+import requests
+
+from contest import CONTESTS, categorize_photo
+from taxa import TaxonStore
+
+BEE = {"id": 1, "name": "Apis", "rank": "genus", "ancestor_ids": [48460, 1, 47120]}
+
+
+class FlakyClient:
+    """Answers the first `/taxa` request, then fails like a dropped connection."""
+
+    def __init__(self, answers=1):
+        self.answers = answers
+        self.requests = []
+
+    def get_json(self, path, params):
+        self.requests.append(path)
+        if len(self.requests) > self.answers:
+            raise requests.exceptions.ConnectionError("connection reset")
+        ids = [int(i) for i in path.split("/")[1].split(",")]
+        return {"results": [{**BEE, "id": taxon_id} for taxon_id in ids]}
+
+
+def test_failed_lookup_raises_and_keeps_earlier_batches(tmp_path):
+    client = FlakyClient(answers=1)
+    store = TaxonStore(str(tmp_path / "taxa.db"), client)
+    with pytest.raises(requests.exceptions.RequestException):
+        store.lookup(range(1, 61))  # two batches; the second fails
+    assert len(client.requests) == 2
+    assert len(TaxonStore(str(tmp_path / "taxa.db"))) == 30  # flushed to SQLite
+
+
+def test_empty_store_still_resolves_taxa(tmp_path):
+    store = TaxonStore(str(tmp_path / "taxa.db"))
+    assert len(store) == 0
+    observation = {"taxon": {"id": 1, "name": "Apis"}}
+    assert categorize_photo(observation, CONTESTS[2026], store) == "others"
+    store.stage(BEE)
+    assert categorize_photo(observation, CONTESTS[2026], store) == "arthropods"
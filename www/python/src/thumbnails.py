@@ -0,0 +1,264 @@
+"""Local thumbnail proxy for the gallery's photo cards.
+
+Registered on the contest app with `init_app(app)`.  A card image is
+fetched from iNaturalist once, shrunk to card size and stored in a
+content-addressed disk cache: `blobs/<digest>` holds the thumbnail and
+`refs/<key>` maps the source photo to its digest.  Blobs are evicted least
+recently served first once the cache outgrows its budget.  iNaturalist never
+changes the file behind a photo id, so thumbnails are served as immutable.
+Only the photos of the galleries' cards are proxied; any other photo id is
+redirected to iNaturalist, so outside requests can neither fill the cache
+nor tie up workers with downloads.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import click
+import requests
+from flask import Blueprint, Response, current_app, redirect, request, url_for
+
+from inat import USER_AGENT
+from metrics import cache_result
+from obs_cache import file_lock, write_bytes_atomic
+
+try:
+    from PIL import Image
+except ImportError:  # optional: serve the source image unresized
+    Image = None
+
+bp = Blueprint("thumbnails", __name__, cli_group=None)
+
+PHOTO_HOSTS = {
+    "open-data": "https://inaturalist-open-data.s3.amazonaws.com/photos",
+    "static": "https://static.inaturalist.org/photos",
+}
+_PHOTO_URL = re.compile(
+    r"^(?P<base>https://[^/]+/photos)/(?P<photo_id>\d+)/\w+\.(?P<ext>jpe?g|png|gif)$"
+)
+_HOST_KEYS = {base: host for host, base in PHOTO_HOSTS.items()}
+CARD_SIZE = (600, 400)  # 2x the card's 18rem x 200px, so it stays sharp on HiDPI
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def fetch_url(url):
+    response = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+
+def shrink(data, size=CARD_SIZE):
+    """Return `data` as a JPEG no larger than `size`, or unchanged without Pillow."""
+    if Image is None:
+        return data
+    with Image.open(BytesIO(data)) as image:
+        image.thumbnail(size)
+        output = BytesIO()
+        image.convert("RGB").save(output, "JPEG", quality=82, optimize=True)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    def __init__(
+        self, cache_dir, fetch=None, size=CARD_SIZE, max_bytes=512 * 2**20, logger=None
+    ):
+        """`fetch(url)` returns the source image's bytes (inject one to run offline)."""
+        self.cache_dir = cache_dir
+        self.fetch = fetch or fetch_url
+        self.size = size
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self._blobs = None  # digest -> size, least recently served first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "refs"), exist_ok=True)
+
+    # --------------------------------------------------------------
+    # Public API
+    # --------------------------------------------------------------
+    def get(self, source_url):
+        """Return `(digest, thumbnail bytes)` for a source image, fetching it once."""
+        digest = self._read_ref(source_url)
+        if digest is not None:
+            data = self._read_blob(digest)
+            if data is not None:
+                cache_result("thumbnails", "hit")
+                return digest, data
+
+        cache_result("thumbnails", "miss")
+        data = shrink(self.fetch(source_url), self.size)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        write_bytes_atomic(self._blob_path(digest), data)
+        write_bytes_atomic(self._ref_path(source_url), digest.encode())
+        self._stored(digest, len(data))
+        return digest, data
+
+    def warm(self, source_urls):
+        """Fetch every thumbnail not cached yet; return how many were fetched."""
+        fetched = 0
+        for url in source_urls:
+            digest = self._read_ref(url)
+            if digest is not None and os.path.exists(self._blob_path(digest)):
+                continue
+            try:
+                self.get(url)
+                fetched += 1
+            except (requests.exceptions.RequestException, OSError) as e:
+                self.logger.warning(f"Could not warm thumbnail of {url}: {e}")
+        return fetched
+
+    def warm_in_background(self, source_urls):
+        """Warm in a thread, unless another process is warming this cache already."""
+
+        def run(urls):
+            lock = os.path.join(self.cache_dir, "warm.lock")
+            with file_lock(lock, blocking=False) as locked:
+                if locked:
+                    fetched = self.warm(urls)
+                    self.logger.info(f"Warmed {fetched} of {len(urls)} thumbnails")
+
+        threading.Thread(target=run, args=(list(source_urls),), daemon=True).start()
+
+    def total_bytes(self):
+        with self._lock:
+            self._scan()
+            return self._total
+
+    # --------------------------------------------------------------
+    # Internals
+    # --------------------------------------------------------------
+    def _ref_path(self, source_url):
+        key = hashlib.sha256(f"{source_url}|{self.size}".encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, "refs", key)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "blobs", digest)
+
+    def _read_ref(self, source_url):
+        try:
+            with open(self._ref_path(source_url), "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _read_blob(self, digest):
+        path = self._blob_path(digest)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # recency survives restarts through the mtime
+        except FileNotFoundError:
+            return None  # evicted; the caller re-fetches
+        with self._lock:
+            self._scan()
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+        return data
+
+    def _stored(self, digest, size):
+        with self._lock:
+            self._scan()
+            self._total += size - self._blobs.pop(digest, 0)
+            self._blobs[digest] = size
+            while self._total > self.max_bytes and len(self._blobs) > 1:
+                victim, victim_size = self._blobs.popitem(last=False)
+                self._total -= victim_size
+                try:
+                    os.unlink(self._blob_path(victim))
+                except FileNotFoundError:
+                    pass  # another worker evicted it first
+                self.logger.info(f"Evicted thumbnail {victim}")
+
+    def _scan(self):
+        """Load the blobs on disk, oldest first, on first use (lock held)."""
+        if self._blobs is not None:
+            return
+        entries = []
+        with os.scandir(os.path.join(self.cache_dir, "blobs")) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._blobs = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._total = sum(self._blobs.values())
+
+
+# ------------------------------------------------------------------
+# Flask integration
+# ------------------------------------------------------------------
+def init_app(app, photo_ids, fetch=None):
+    """Register the proxy route and the `thumbnail` template filter on `app`.
+
+    `photo_ids()` returns the set of photo ids the galleries show now (see
+    `photo_id_of`); only those are proxied.
+    """
+    app.extensions["thumbnails"] = ThumbnailCache(
+        app.config["THUMBNAIL_DIR"],
+        fetch=fetch,
+        max_bytes=app.config["THUMBNAIL_CACHE_MB"] * 2**20,
+        logger=app.logger,
+    )
+    app.extensions["thumbnail_photo_ids"] = photo_ids
+    app.add_template_filter(thumbnail_url, "thumbnail")
+    app.register_blueprint(bp)
+
+
+def thumbnail_cache():
+    return current_app.extensions["thumbnails"]
+
+
+def photo_id_of(photo_url):
+    """The iNaturalist photo id of a proxied photo URL, or None."""
+    match = _PHOTO_URL.match(photo_url or "")
+    if match is None or match["base"] not in _HOST_KEYS:
+        return None
+    return int(match["photo_id"])
+
+
+def thumbnail_url(photo_url):
+    """The proxy URL of an iNaturalist photo; other URLs are returned unchanged."""
+    match = _PHOTO_URL.match(photo_url or "")
+    if match is None or match["base"] not in _HOST_KEYS:
+        return photo_url
+    return url_for(
+        "thumbnails.thumbnail",
+        host=_HOST_KEYS[match["base"]],
+        photo_id=int(match["photo_id"]),
+        ext=match["ext"],
+    )
+
+
+@bp.route(
+    "/thumbs/<any('open-data', static):host>/<int:photo_id>.<any(jpg, jpeg, png, gif):ext>"
+)
+def thumbnail(host, photo_id, ext):
+    source_url = f"{PHOTO_HOSTS[host]}/{photo_id}/medium.{ext}"
+    if photo_id not in current_app.extensions["thumbnail_photo_ids"]():
+        cache_result("thumbnails", "refused")
+        return redirect(source_url)  # not a card of ours: not worth a cache slot
+    try:
+        digest, data = thumbnail_cache().get(source_url)
+    except (requests.exceptions.RequestException, OSError) as e:
+        current_app.logger.warning(f"Thumbnail of {source_url} unavailable: {e}")
+        return redirect(source_url)  # let the browser try the original
+
+    mimetype = "image/jpeg" if Image is not None else f"image/{ext.replace('jpg', 'jpeg')}"
+    response = Response(data, mimetype=mimetype)
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.set_etag(digest)
+    return response.make_conditional(request)
+
+
+@bp.cli.command("thumbnail-info")
+def thumbnail_info_command():
+    """Report the size of the thumbnail cache."""
+    cache = thumbnail_cache()
+    click.echo(
+        f"{cache.total_bytes() / 2**20:.1f} MiB of "
+        f"{cache.max_bytes / 2**20:.0f} MiB in {cache.cache_dir}"
+    )